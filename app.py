@@ -1,17 +1,30 @@
 
 import os
-import random
 import numpy as np
-from flask import Flask, render_template, request, jsonify
-from PIL import Image
-import io
+from flask import Flask, Response, g, render_template, request, jsonify
 import base64
-import requests
+import hashlib
+import json
+import math
+import threading
+import time
 from dotenv import load_dotenv
 
+from backends import create_backend
+from batching import AdmissionController, DeadlineExceeded, MicroBatcher
+from cache import PerceptualHashIndex, PersistentPredictionCache, PredictionCache, content_key
+from http_pool import PooledHTTPClient, UpstreamError, UpstreamTimeout
+from preprocessing import (
+    INPUT_SHAPE, BatchBufferPool, decode_image, normalize_into, perceptual_hash
+)
+from tune_threads import apply_thread_config
+
 # Load environment variables from .env file
 load_dotenv()
 
+# Thread counts chosen by tune_threads.py, as defaults under explicit settings
+apply_thread_config()
+
 # ==========================================
 # CONFIGURATION
 # ==========================================
@@ -21,30 +34,106 @@ OPENROUTER_API_KEY = os.environ.get('OPENROUTER_API_KEY', '')
 OPENROUTER_MODEL = "nvidia/nemotron-nano-9b-v2:free"  # Working free model
 OPENROUTER_API_URL = "https://openrouter.ai/api/v1/chat/completions"
 
+# Connection pool for the OpenRouter API (see http_pool.py): connections are
+# kept alive and reused across chat messages instead of a new TLS handshake each
+CHAT_POOL_SIZE = int(os.environ.get('CHAT_POOL_SIZE', '10'))
+CHAT_KEEP_ALIVE = os.environ.get('CHAT_KEEP_ALIVE', 'true').lower() == 'true'
+CHAT_CONNECT_TIMEOUT = float(os.environ.get('CHAT_CONNECT_TIMEOUT', '5'))
+CHAT_READ_TIMEOUT = float(os.environ.get('CHAT_READ_TIMEOUT', '30'))
+CHAT_HTTP2 = os.environ.get('CHAT_HTTP2', 'false').lower() == 'true'
+
 DEMO_MODE = os.environ.get('DEMO_MODE', 'false').lower() == 'true'
 
-# TensorFlow import with error handling
+# Demo-mode latency model, for load-testing the HTTP layer without TensorFlow
+# (see DemoBackend): 'fixed', 'normal' or 'replay' of a recorded trace, plus a
+# per-extra-image cost so micro-batching behaves like it does on a real model
+DEMO_LATENCY_MS = float(os.environ.get('DEMO_LATENCY_MS', '500'))
+DEMO_LATENCY_DISTRIBUTION = os.environ.get('DEMO_LATENCY_DISTRIBUTION', 'fixed').lower()
+DEMO_LATENCY_STDDEV_MS = float(os.environ.get('DEMO_LATENCY_STDDEV_MS', '0'))
+DEMO_LATENCY_TRACE = os.environ.get('DEMO_LATENCY_TRACE') or None
+DEMO_PER_ITEM_MS = float(os.environ.get('DEMO_PER_ITEM_MS', '0'))
+DEMO_PARALLELISM = int(os.environ.get('DEMO_PARALLELISM', '0'))
+
+# Inference backend (see backends.py): 'compiled' (traced tf.functions),
+# 'keras' (model.predict), 'tflite', 'onnx' or 'demo'. Only the Keras-based
+# backends import TensorFlow.
+MODEL_BACKEND = os.environ.get('MODEL_BACKEND', 'compiled').lower()
+TFLITE_NUM_THREADS = int(os.environ.get('TFLITE_NUM_THREADS', '0')) or None
+# Interpreters each thread keeps, one per power-of-two batch size (each holds its own arena)
+TFLITE_INTERPRETERS_PER_THREAD = int(os.environ.get('TFLITE_INTERPRETERS_PER_THREAD', '4'))
+ONNX_INTRA_OP_THREADS = int(os.environ.get('ONNX_INTRA_OP_THREADS', '0'))
+ONNX_INTER_OP_THREADS = int(os.environ.get('ONNX_INTER_OP_THREADS', '0'))
+# TensorFlow thread pools for the Keras-based backends (0 = one thread per core).
+# Set them when several worker processes share one host; gunicorn.conf.py does.
+TF_INTRA_OP_THREADS = int(os.environ.get('TF_INTRA_OP_THREADS', '0'))
+TF_INTER_OP_THREADS = int(os.environ.get('TF_INTER_OP_THREADS', '0'))
+
+# Numeric precision of the served model. 'bfloat16' runs Keras layers under a
+# mixed-precision policy; for TFLite 'float16'/'int8' select model_<precision>.tflite
+# produced by convert_model.py --quantize.
+MODEL_PRECISION = os.environ.get('MODEL_PRECISION', 'float32').lower()
+
+# Load the model when the module is imported instead of on the first request.
+# Use this for multi-worker servers so no user request pays the load cost.
+EAGER_LOAD = os.environ.get('EAGER_LOAD', 'false').lower() == 'true'
+
+# Micro-batching: concurrent /predict requests share one forward pass
+BATCHING_ENABLED = os.environ.get('BATCHING_ENABLED', 'true').lower() == 'true'
+BATCH_MAX_SIZE = int(os.environ.get('BATCH_MAX_SIZE', '8'))
+BATCH_MAX_WAIT_MS = float(os.environ.get('BATCH_MAX_WAIT_MS', '5'))
+
+# Admission control: at most this many /predict and /predict/batch requests are
+# worked on at once; the rest get 429 with Retry-After instead of queueing
+# (each queued request holds its upload and decoded image). 0 disables.
+ADMISSION_MAX_IN_FLIGHT = int(os.environ.get('ADMISSION_MAX_IN_FLIGHT', '64'))
+
+# Deadlines: clients send X-Request-Timeout-Ms (how long they will wait); requests
+# without it get PREDICT_DEFAULT_BUDGET_MS (0 = no deadline). Expired requests are
+# dropped before decode, before inference and in the batch queue, with a 504.
+PREDICT_DEFAULT_BUDGET_MS = float(os.environ.get('PREDICT_DEFAULT_BUDGET_MS', '10000'))
+
+# Compiled backend: traced batch sizes 1..COMPILED_MAX_BATCH (larger batches are sliced)
+COMPILED_MAX_BATCH = int(os.environ.get('COMPILED_MAX_BATCH', str(BATCH_MAX_SIZE)))
+
+# /predict/batch: images per model call (larger requests are chunked)
+PREDICT_BATCH_CHUNK_SIZE = int(os.environ.get('PREDICT_BATCH_CHUNK_SIZE', '32'))
+
+# Warm-up: run synthetic batches through the model before it is published, so
+# graph tracing and allocator setup don't land on the first real requests.
+# Defaults to every size the micro-batcher and /predict/batch can produce.
+WARMUP_ENABLED = os.environ.get('WARMUP_ENABLED', 'true').lower() == 'true'
+WARMUP_BATCH_SIZES = sorted({
+    int(size) for size in os.environ.get(
+        'WARMUP_BATCH_SIZES',
+        ','.join(str(size) for size in list(range(1, BATCH_MAX_SIZE + 1)) + [PREDICT_BATCH_CHUNK_SIZE])
+    ).split(',') if size.strip()
+})
+WARMUP_ITERATIONS = int(os.environ.get('WARMUP_ITERATIONS', '2'))
+
+# In-process result cache keyed by image bytes + model version, so re-submitted
+# scans skip decode and inference entirely
+RESULT_CACHE_ENABLED = os.environ.get('RESULT_CACHE_ENABLED', 'true').lower() == 'true'
+RESULT_CACHE_MAX_ENTRIES = int(os.environ.get('RESULT_CACHE_MAX_ENTRIES', '1024'))
+RESULT_CACHE_TTL_SECONDS = float(os.environ.get('RESULT_CACHE_TTL_SECONDS', '3600'))
+
+# Optional on-disk prediction store (SQLite) shared by all workers on the host
+# and kept across restarts. Empty path disables it.
+PREDICTION_DB_PATH = os.environ.get('PREDICTION_DB_PATH', '')
+PREDICTION_DB_MAX_ENTRIES = int(os.environ.get('PREDICTION_DB_MAX_ENTRIES', '100000'))
+PREDICTION_DB_TTL_SECONDS = float(os.environ.get('PREDICTION_DB_TTL_SECONDS', '0'))
+
+# Near-duplicate detection by perceptual hash of the decoded 299x299 pixels, for
+# re-exports of a scan whose bytes differ. 'off', 'flag' (report the match but
+# still run inference) or 'reuse' (serve the cached prediction of the match).
+NEAR_DUPLICATE_POLICY = os.environ.get('NEAR_DUPLICATE_POLICY', 'off').lower()
+NEAR_DUPLICATE_MAX_DISTANCE = int(os.environ.get('NEAR_DUPLICATE_MAX_DISTANCE', '4'))
+NEAR_DUPLICATE_INDEX_SIZE = int(os.environ.get('NEAR_DUPLICATE_INDEX_SIZE', str(RESULT_CACHE_MAX_ENTRIES)))
+
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
 
-if not DEMO_MODE:
-    try:
-        import tensorflow as tf
-        TF_AVAILABLE = True
-        
-        # Configure GPU memory growth to avoid OOM errors
-        gpus = tf.config.experimental.list_physical_devices('GPU')
-        if gpus:
-            try:
-                for gpu in gpus:
-                    tf.config.experimental.set_memory_growth(gpu, True)
-            except RuntimeError as e:
-                print(f"GPU configuration error: {e}")
-    except ImportError:
-        TF_AVAILABLE = False
-        print("TensorFlow not available. Running in DEMO mode.")
-        DEMO_MODE = True
-else:
-    TF_AVAILABLE = False
+if DEMO_MODE or MODEL_BACKEND == 'demo':
+    DEMO_MODE = True
+    MODEL_BACKEND = 'demo'
     print("Running in DEMO mode - model predictions will be simulated")
 
 app = Flask(__name__)
@@ -53,95 +142,418 @@ app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 # Model path
 MODEL_PATH = os.path.join(os.path.dirname(__file__), 'model.h5')
 CONVERTED_MODEL_PATH = os.path.join(os.path.dirname(__file__), 'model_converted.keras')
+TFLITE_MODEL_PATH = os.environ.get(
+    'TFLITE_MODEL_PATH',
+    os.path.join(
+        os.path.dirname(__file__),
+        'model.tflite' if MODEL_PRECISION == 'float32' else f'model_{MODEL_PRECISION}.tflite'
+    )
+)
+ONNX_MODEL_PATH = os.environ.get(
+    'ONNX_MODEL_PATH', os.path.join(os.path.dirname(__file__), 'model.onnx')
+)
 
 # Class labels for brain tumor classification
 CLASS_LABELS = ['Glioma', 'Meningioma', 'No Tumor', 'Pituitary']
 
-# Global model variable
-model = None
+# Global inference backend (loaded on first use)
+backend = None
+_backend_lock = threading.Lock()
 
+# Backend whose fork-safe loading already ran in a pre-fork master (see preload_model)
+_preloaded_backend = None
 
-def load_model():
-    """Load the trained model with legacy Keras compatibility."""
-    global model
+# Result of the startup warm-up pass, reported in /health
+warmup_report = None
+
+# Measured inference latency, reported in /health
+_inference_stats = {'batches': 0, 'images': 0, 'total_seconds': 0.0, 'last_ms': 0.0}
+_inference_stats_lock = threading.Lock()
+
+# Global micro-batcher (created on first use)
+batcher = None
+_batcher_lock = threading.Lock()
+
+# Admission control for the prediction routes
+admission = AdmissionController(ADMISSION_MAX_IN_FLIGHT) if ADMISSION_MAX_IN_FLIGHT > 0 else None
+
+# Requests dropped at each stage because their deadline had passed
+_expired_requests = {'before_decode': 0, 'before_enqueue': 0}
+_expired_requests_lock = threading.Lock()
+
+# Prediction result cache
+result_cache = PredictionCache(RESULT_CACHE_MAX_ENTRIES, RESULT_CACHE_TTL_SECONDS) if RESULT_CACHE_ENABLED else None
+prediction_store = (
+    PersistentPredictionCache(PREDICTION_DB_PATH, PREDICTION_DB_MAX_ENTRIES, PREDICTION_DB_TTL_SECONDS)
+    if PREDICTION_DB_PATH else None
+)
+_model_versions = {}
+near_duplicates = (
+    PerceptualHashIndex(NEAR_DUPLICATE_INDEX_SIZE, NEAR_DUPLICATE_MAX_DISTANCE)
+    if NEAR_DUPLICATE_POLICY in ('flag', 'reuse') and (result_cache is not None or prediction_store is not None)
+    else None
+)
+
+# Shared keep-alive connection pool for chatbot requests
+chat_http = PooledHTTPClient(
+    pool_size=CHAT_POOL_SIZE,
+    keep_alive=CHAT_KEEP_ALIVE,
+    connect_timeout=CHAT_CONNECT_TIMEOUT,
+    read_timeout=CHAT_READ_TIMEOUT,
+    http2=CHAT_HTTP2
+)
+
+# Time to first token of streamed chat replies, reported in /health
+_chat_stream_stats = {'streams': 0, 'first_tokens': 0, 'total_ttft': 0.0, 'last_ttft_ms': None, 'errors': 0}
+_chat_stream_stats_lock = threading.Lock()
+
+# Reusable float32 input buffers for /predict/batch chunks
+PREPROCESS_BUFFER_POOL_SIZE = int(os.environ.get('PREPROCESS_BUFFER_POOL_SIZE', '4'))
+chunk_buffers = BatchBufferPool(PREDICT_BATCH_CHUNK_SIZE, max_buffers=PREPROCESS_BUFFER_POOL_SIZE)
+
+
+def backend_options(name):
+    """Return the configured constructor options for a registered backend."""
+    keras_model_path = CONVERTED_MODEL_PATH if os.path.exists(CONVERTED_MODEL_PATH) else MODEL_PATH
+    options = {
+        'keras': {
+            'model_path': keras_model_path,
+            'precision': MODEL_PRECISION,
+            'intra_op_threads': TF_INTRA_OP_THREADS,
+            'inter_op_threads': TF_INTER_OP_THREADS,
+        },
+        'compiled': {
+            'model_path': keras_model_path,
+            'precision': MODEL_PRECISION,
+            'intra_op_threads': TF_INTRA_OP_THREADS,
+            'inter_op_threads': TF_INTER_OP_THREADS,
+            'max_batch_size': COMPILED_MAX_BATCH,
+        },
+        'tflite': {
+            'model_path': TFLITE_MODEL_PATH,
+            'precision': MODEL_PRECISION,
+            'num_threads': TFLITE_NUM_THREADS,
+            'max_interpreters': TFLITE_INTERPRETERS_PER_THREAD,
+        },
+        'onnx': {
+            'model_path': ONNX_MODEL_PATH,
+            'precision': MODEL_PRECISION,
+            'intra_op_threads': ONNX_INTRA_OP_THREADS,
+            'inter_op_threads': ONNX_INTER_OP_THREADS,
+        },
+        'demo': {
+            'latency_ms': DEMO_LATENCY_MS,
+            'latency_distribution': DEMO_LATENCY_DISTRIBUTION,
+            'latency_stddev_ms': DEMO_LATENCY_STDDEV_MS,
+            'latency_trace': DEMO_LATENCY_TRACE,
+            'per_item_ms': DEMO_PER_ITEM_MS,
+            'parallelism': DEMO_PARALLELISM,
+        },
+    }
+    return options.get(name, {})
+
+
+def create_configured_backend(name):
+    """Create (but do not load) a backend using this server's configuration."""
+    return create_backend(name, CLASS_LABELS, **backend_options(name))
+
+
+def warmup_backend(candidate, batch_sizes=None):
+    """Run synthetic batches of every configured size on this thread and record their latency."""
+    batch_sizes = WARMUP_BATCH_SIZES if batch_sizes is None else list(batch_sizes)
+    latencies = {}
+    start = time.perf_counter()
+    
+    for size in batch_sizes:
+        batch = np.random.rand(size, *INPUT_SHAPE).astype(np.float32)
+        for _ in range(max(1, WARMUP_ITERATIONS)):
+            call_start = time.perf_counter()
+            candidate.predict_batch(batch)
+            # Keep the last (warm) call as the steady-state estimate
+            latencies[size] = round((time.perf_counter() - call_start) * 1000, 3)
+    
+    report = {
+        'duration_ms': round((time.perf_counter() - start) * 1000, 3),
+        'batch_latency_ms': latencies,
+    }
+    print(f"Warm-up finished in {report['duration_ms'] / 1000:.1f}s "
+          f"over batch sizes {', '.join(str(size) for size in batch_sizes)}")
+    return report
+
+
+def model_version():
+    """Identify the configured model without loading it.
+    
+    Combines backend, precision and a hash of the model file, so cached results
+    are never served across a model swap but do survive a redeploy of the same
+    model. MODEL_VERSION overrides it.
+    """
+    if 'MODEL_VERSION' in os.environ:
+        return os.environ['MODEL_VERSION']
     
+    if MODEL_BACKEND not in _model_versions:
+        version = f'{MODEL_BACKEND}:{MODEL_PRECISION}'
+        model_path = backend_options(MODEL_BACKEND).get('model_path')
+        if model_path and os.path.exists(model_path):
+            digest = hashlib.blake2b(digest_size=8)
+            with open(model_path, 'rb') as f:
+                for block in iter(lambda: f.read(1024 * 1024), b''):
+                    digest.update(block)
+            version += f':{digest.hexdigest()}'
+        _model_versions[MODEL_BACKEND] = version
+    
+    return _model_versions[MODEL_BACKEND]
+
+
+def cache_key(image_bytes):
+    """Return the result-cache key for an upload, or None when caching is off.
+    
+    Simulated predictions are never cached. The backend is loaded first,
+    since load_model() falls back to demo mode when the configured runtime
+    is missing and the key must not carry the real model's version then.
+    """
+    if result_cache is None and prediction_store is None:
+        return None
+    load_model()
     if DEMO_MODE:
-        print("DEMO MODE: Skipping model loading")
+        return None
+    return content_key(image_bytes, model_version())
+
+
+def cached_prediction(key):
+    """Look up probabilities in the memory cache, then the on-disk store."""
+    if key is None:
         return None
     
-    if model is None:
-        print("Loading model...")
-        
-        # Try loading converted model first
-        model_path = CONVERTED_MODEL_PATH if os.path.exists(CONVERTED_MODEL_PATH) else MODEL_PATH
-        print(f"Using model: {model_path}")
+    probs = result_cache.get(key) if result_cache is not None else None
+    if probs is None and prediction_store is not None:
+        probs = prediction_store.get(key)
+        # Promote disk hits so repeats are served from memory
+        if probs is not None and result_cache is not None:
+            result_cache.put(key, probs)
+    return probs
+
+
+def store_prediction(key, probs, phash=None):
+    """Record freshly computed probabilities in every enabled cache tier."""
+    if key is None:
+        return
+    if result_cache is not None:
+        result_cache.put(key, probs)
+    # The store outlives this process, so a simulated result must never reach it
+    if prediction_store is not None and not DEMO_MODE:
+        prediction_store.put(key, probs)
+    if near_duplicates is not None and phash is not None:
+        near_duplicates.add(phash, key)
+
+
+def find_near_duplicate(pixels):
+    """Look up decoded pixels in the perceptual-hash index.
+    
+    Returns (phash, match) where match is (probs, distance) for a still-cached
+    near-duplicate, or None. phash is None when near-duplicate detection is off.
+    """
+    if near_duplicates is None:
+        return None, None
+    
+    phash = perceptual_hash(pixels)
+    match = near_duplicates.nearest(phash)
+    if match is None:
+        return phash, None
+    
+    key, distance = match
+    probs = cached_prediction(key)
+    return phash, (probs, distance) if probs is not None else None
+
+
+def preload_model():
+    """Run the backend's fork-safe loading step in a pre-fork server master.
+    
+    Model bytes read here are inherited by every worker and shared
+    copy-on-write; each worker still calls load_model() after fork to start
+    its runtime, since TensorFlow and ONNX Runtime thread pools do not
+    survive fork. A model file that can't be read is left for load_model()
+    to report in the worker.
+    """
+    global _preloaded_backend
+    
+    candidate = create_configured_backend(MODEL_BACKEND)
+    try:
+        candidate.preload()
+    except OSError as e:
+        print(f"Could not preload the '{MODEL_BACKEND}' model: {e}")
+        return
+    _preloaded_backend = candidate
+
+
+def load_model():
+    """Load the configured inference backend, falling back to demo mode if its runtime is missing.
+    
+    Loading is single-flight: the first caller loads while concurrent callers
+    wait on the lock and then reuse the same backend.
+    """
+    global backend, warmup_report, DEMO_MODE, MODEL_BACKEND
+    
+    if backend is not None:
+        return backend
+    
+    with _backend_lock:
+        if backend is not None:
+            return backend
         
+        print(f"Loading model with the '{MODEL_BACKEND}' backend...")
+        start = time.perf_counter()
+        candidate = _preloaded_backend or create_configured_backend(MODEL_BACKEND)
         try:
-            # Use tf_keras (legacy Keras 2.x) for loading old format models
-            import tf_keras
-            model = tf_keras.models.load_model(model_path, compile=False)
-            print("Model loaded successfully using tf_keras!")
-        except ImportError:
-            print("tf_keras not installed. Trying standard TensorFlow...")
-            try:
-                model = tf.keras.models.load_model(model_path, compile=False)
-                print("Model loaded successfully!")
-            except Exception as e:
-                print(f"Error loading model: {e}")
-                raise e
-        except Exception as e:
-            print(f"Error loading model: {e}")
-            print("\n" + "="*60)
-            print("MODEL LOADING FAILED")
-            print("="*60)
-            print("This is likely due to Keras 2.x vs 3.x incompatibility.")
-            print("\nOptions:")
-            print("1. Run in DEMO mode: Set DEMO_MODE=true environment variable")
-            print("2. Install TensorFlow 2.15: pip install tensorflow==2.15.0")
-            print("3. Convert the model using convert_model.py")
-            print("="*60 + "\n")
-            raise e
+            candidate.load()
+        except ImportError as e:
+            print(f"Runtime for the '{MODEL_BACKEND}' backend not available ({e}). Running in DEMO mode.")
+            DEMO_MODE = True
+            MODEL_BACKEND = 'demo'
+            candidate = create_configured_backend(MODEL_BACKEND)
+            candidate.load()
+        if WARMUP_ENABLED and candidate.needs_warmup:
+            warmup_report = warmup_backend(candidate)
+            # The loading thread (gunicorn's post_fork) may never serve a request;
+            # don't keep its runtime state, sized for the largest warm-up batch
+            candidate.release_thread_state()
+        print(f"Model ready in {time.perf_counter() - start:.1f}s")
+        
+        # Publish only once fully loaded so the lock-free check above never
+        # sees a half-initialized backend
+        backend = candidate
+    
+    if BATCHING_ENABLED and candidate.thread_local_state:
+        # Start the batcher now so it warms its own thread before traffic arrives
+        get_batcher()
     
-    return model
+    return backend
+
 
+def warm_batcher_thread():
+    """Warm the batcher thread's runtime state when the backend keeps it per thread."""
+    loaded_backend = load_model()
+    if WARMUP_ENABLED and loaded_backend.needs_warmup and loaded_backend.thread_local_state:
+        warmup_backend(loaded_backend, range(1, BATCH_MAX_SIZE + 1))
 
-def preprocess_image(image_data):
-    """Preprocess the uploaded image for model prediction."""
-    # Open image from bytes
-    image = Image.open(io.BytesIO(image_data))
+
+def run_inference(batch):
+    """Return class probabilities for a preprocessed (N, 299, 299, 3) batch."""
+    loaded_backend = load_model()
     
-    # Convert to RGB if necessary
-    if image.mode != 'RGB':
-        image = image.convert('RGB')
+    start = time.perf_counter()
+    outputs = loaded_backend.predict_batch(batch)
+    record_inference(len(batch), time.perf_counter() - start)
     
-    # Resize to model input size (299x299 based on model.input_shape)
-    image = image.resize((299, 299))
+    return outputs
+
+
+def record_inference(images, elapsed):
+    """Add one model call of `images` images taking `elapsed` seconds to the inference stats."""
+    with _inference_stats_lock:
+        _inference_stats['batches'] += 1
+        _inference_stats['images'] += images
+        _inference_stats['total_seconds'] += elapsed
+        _inference_stats['last_ms'] = elapsed * 1000
+
+
+def inference_stats():
+    """Return the backend in use and its measured inference latency."""
+    with _inference_stats_lock:
+        stats = dict(_inference_stats)
     
-    # Convert to numpy array and normalize
-    img_array = np.array(image) / 255.0
+    return {
+        'backend': backend.describe() if backend is not None else {'name': MODEL_BACKEND},
+        'precision': MODEL_PRECISION,
+        'batches': stats['batches'],
+        'images': stats['images'],
+        'last_batch_latency_ms': round(stats['last_ms'], 3),
+        'avg_batch_latency_ms': round(stats['total_seconds'] / stats['batches'] * 1000, 3) if stats['batches'] else None,
+        'avg_latency_per_image_ms': round(stats['total_seconds'] / stats['images'] * 1000, 3) if stats['images'] else None,
+    }
+
+
+def request_deadline(headers):
+    """Return the perf_counter() deadline for a prediction request, or None.
     
-    # Add batch dimension
-    img_array = np.expand_dims(img_array, axis=0)
+    Raises ValueError if the client's X-Request-Timeout-Ms header is malformed.
+    Only PREDICT_DEFAULT_BUDGET_MS uses 0 for "no deadline": a client budget of
+    zero or less is already spent, so the request expires at its first check.
+    """
+    header = headers.get('X-Request-Timeout-Ms')
+    if header:
+        budget_ms = float(header)
+        if not math.isfinite(budget_ms):
+            raise ValueError(f'X-Request-Timeout-Ms must be a finite number, got {header!r}')
+        return time.perf_counter() + max(budget_ms, 0.0) / 1000
     
-    return img_array
+    budget_ms = PREDICT_DEFAULT_BUDGET_MS
+    return time.perf_counter() + budget_ms / 1000 if budget_ms > 0 else None
+
 
+def check_deadline(stage, deadline):
+    """Raise DeadlineExceeded (and count it) if the client has stopped waiting."""
+    if deadline is not None and time.perf_counter() >= deadline:
+        with _expired_requests_lock:
+            _expired_requests[stage] += 1
+        raise DeadlineExceeded(f'Request deadline passed {stage.replace("_", " ")}')
 
-def demo_predict():
-    """Generate a simulated prediction for demo mode."""
-    # Generate random probabilities
-    probs = np.random.dirichlet(np.ones(4) * 2)  # More realistic distribution
+
+def deadline_stats():
+    """Return the default budget and expired-request counts per stage."""
+    with _expired_requests_lock:
+        expired = dict(_expired_requests)
+    batcher_stats = batcher.stats() if batcher is not None else {}
+    expired['in_batch_queue'] = batcher_stats.get('expired', 0)
+    # The client's deadline passed after its batch had started running
+    expired['during_inference'] = batcher_stats.get('expired_in_flight', 0)
     
-    # Sometimes make one class more dominant for realistic results
-    if random.random() > 0.3:
-        dominant_idx = random.randint(0, 3)
-        probs[dominant_idx] += 0.5
-        probs = probs / probs.sum()
+    return {
+        'default_budget_ms': PREDICT_DEFAULT_BUDGET_MS,
+        'expired': expired,
+    }
+
+
+def get_batcher():
+    """Return the shared micro-batcher, starting it on first use."""
+    global batcher
+    
+    if batcher is None:
+        with _batcher_lock:
+            if batcher is None:
+                batcher = MicroBatcher(
+                    run_inference,
+                    INPUT_SHAPE,
+                    max_batch_size=BATCH_MAX_SIZE,
+                    max_wait_ms=BATCH_MAX_WAIT_MS,
+                    fill_row=normalize_into,
+                    warmup_fn=warm_batcher_thread
+                )
     
-    predicted_idx = np.argmax(probs)
+    return batcher
+
+
+def is_raw_image_upload():
+    """Return True if the request body is a raw image (not JSON or multipart)."""
+    return request.mimetype == 'application/octet-stream' or request.mimetype.startswith('image/')
+
+
+def decode_base64_image(image_data):
+    """Decode a base64 image string, with or without a data URL prefix."""
+    # Remove data URL prefix if present
+    if ',' in image_data:
+        image_data = image_data.split(',')[1]
+    return base64.b64decode(image_data)
+
+
+def format_prediction(probs):
+    """Turn one row of class probabilities into the JSON result fields."""
+    predicted_class_idx = int(np.argmax(probs))
+    confidence = float(probs[predicted_class_idx]) * 100
     
     return {
-        'prediction': CLASS_LABELS[predicted_idx],
-        'confidence': float(probs[predicted_idx]) * 100,
+        'prediction': CLASS_LABELS[predicted_class_idx],
+        'confidence': round(confidence, 2),
         'probabilities': {
             label: float(prob) * 100 
             for label, prob in zip(CLASS_LABELS, probs)
@@ -149,6 +561,96 @@ def demo_predict():
     }
 
 
+def classify_image(image_bytes, deadline=None):
+    """Classify one uploaded image and return the /predict response fields.
+    
+    Shared by the Flask and ASGI apps. Raises DeadlineExceeded once the
+    perf_counter() deadline has passed.
+    """
+    # Re-submitted scan: answer from the cache without decoding or inference
+    key = cache_key(image_bytes)
+    cached_probs = cached_prediction(key)
+    
+    cache_status = 'hit'
+    near_match = None
+    
+    if cached_probs is not None:
+        probs = cached_probs
+    else:
+        cache_status = 'miss'
+        check_deadline('before_decode', deadline)
+        pixels = decode_image(image_bytes)
+        phash, near_match = find_near_duplicate(pixels)
+        
+        if near_match is not None and NEAR_DUPLICATE_POLICY == 'reuse':
+            # Re-export of a scan we already classified
+            probs = near_match[0]
+            cache_status = 'near_duplicate'
+        else:
+            load_model()
+            check_deadline('before_enqueue', deadline)
+            
+            # Make prediction (batched with concurrent requests when enabled).
+            # The batcher normalizes the uint8 pixels straight into its float32 batch.
+            if BATCHING_ENABLED:
+                probs = get_batcher().submit(pixels, deadline=deadline)
+            else:
+                inputs = np.empty((1,) + INPUT_SHAPE, dtype=np.float32)
+                normalize_into(pixels, inputs[0])
+                probs = run_inference(inputs)[0]
+        
+        store_prediction(key, probs, phash)
+    
+    result = {
+        'success': True,
+        **format_prediction(probs)
+    }
+    if key:
+        result['cache'] = cache_status
+    if near_match is not None:
+        result['near_duplicate_distance'] = near_match[1]
+    if DEMO_MODE:
+        result['demo_mode'] = True
+    return result
+
+
+@app.before_request
+def set_request_deadline():
+    """Turn the client's timeout header (or the default budget) into a deadline."""
+    if request.endpoint not in ('predict', 'predict_batch'):
+        return None
+    
+    try:
+        g.deadline = request_deadline(request.headers)
+    except ValueError:
+        return jsonify({'error': 'Invalid X-Request-Timeout-Ms header'}), 400
+    return None
+
+
+@app.before_request
+def admit_request():
+    """Turn prediction requests away with 429 while the server is at capacity."""
+    if admission is None or request.endpoint not in ('predict', 'predict_batch'):
+        return None
+    
+    if not admission.try_acquire():
+        retry_after = admission.retry_after()
+        response = jsonify({'error': 'Server is busy, please retry later', 'retry_after': retry_after})
+        response.status_code = 429
+        response.headers['Retry-After'] = str(retry_after)
+        return response
+    
+    g.admitted = True
+    return None
+
+
+@app.teardown_request
+def release_admission(exc):
+    """Free the admission slot once the request has been answered."""
+    if g.pop('admitted', False):
+        admission.release()
+
+
 @app.route('/')
 def index():
     """Render the main page."""
@@ -157,18 +659,24 @@ def index():
 
 @app.route('/predict', methods=['POST'])
 def predict():
-    """Handle image upload and return prediction."""
+    """Handle image upload and return prediction.
+    
+    Accepts a raw ``image/*`` or ``application/octet-stream`` body, a multipart
+    upload under ``image`` or JSON ``{"image": base64}``.
+    """
     try:
+        if is_raw_image_upload():
+            # Raw binary upload: the body is the image file itself, read once
+            # without base64 or multipart parsing
+            image_bytes = request.get_data(cache=False)
+            if not image_bytes:
+                return jsonify({'error': 'No image provided'}), 400
         # Check if image is in request
-        if 'image' not in request.files:
+        elif 'image' not in request.files:
             # Check for base64 image data
             data = request.get_json()
             if data and 'image' in data:
-                # Remove data URL prefix if present
-                image_data = data['image']
-                if ',' in image_data:
-                    image_data = image_data.split(',')[1]
-                image_bytes = base64.b64decode(image_data)
+                image_bytes = decode_base64_image(data['image'])
             else:
                 return jsonify({'error': 'No image provided'}), 400
         else:
@@ -177,46 +685,116 @@ def predict():
                 return jsonify({'error': 'No image selected'}), 400
             image_bytes = file.read()
         
-        # Demo mode: return simulated prediction
-        if DEMO_MODE:
-            # Small delay to simulate processing
-            import time
-            time.sleep(0.5)
-            
-            result = demo_predict()
-            return jsonify({
-                'success': True,
-                'demo_mode': True,
-                **result
-            })
+        return jsonify(classify_image(image_bytes, g.deadline))
         
-        # Real prediction mode
-        loaded_model = load_model()
+    except DeadlineExceeded as e:
+        return jsonify({'error': str(e)}), 504
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/predict/batch', methods=['POST'])
+def predict_batch():
+    """Classify many images in one request.
+    
+    Accepts multipart uploads under ``images`` or JSON ``{"images": [base64, ...]}``.
+    Results come back in request order; an image that fails to decode gets an
+    ``error`` entry instead of failing the whole batch.
+    """
+    try:
+        # Collect (name, bytes) pairs from either request format
+        items = []
+        files = request.files.getlist('images')
+        if files:
+            for file in files:
+                items.append((file.filename, file.read()))
+        else:
+            data = request.get_json(silent=True)
+            if not data or not isinstance(data.get('images'), list):
+                return jsonify({'error': 'No images provided'}), 400
+            for image_data in data['images']:
+                try:
+                    items.append((None, decode_base64_image(image_data)))
+                except Exception as e:
+                    items.append((None, e))
         
-        # Preprocess image
-        processed_image = preprocess_image(image_bytes)
+        if not items:
+            return jsonify({'error': 'No images provided'}), 400
         
-        # Make prediction
-        predictions = loaded_model.predict(processed_image, verbose=0)
+        results = [None] * len(items)
         
-        # Get prediction results
-        predicted_class_idx = np.argmax(predictions[0])
-        predicted_class = CLASS_LABELS[predicted_class_idx]
-        confidence = float(predictions[0][predicted_class_idx]) * 100
+        # Decode uncached images a chunk at a time, so only one chunk's pixels
+        # are held at once however many images the request carries
+        pending = []
         
-        # Get all class probabilities
-        probabilities = {
-            label: float(prob) * 100 
-            for label, prob in zip(CLASS_LABELS, predictions[0])
-        }
+        def run_chunk():
+            # One vectorized model call, normalized into a pooled float32 buffer
+            check_deadline('before_enqueue', g.deadline)
+            with chunk_buffers.buffer() as buffer:
+                for (_, _, _, _, pixels), row in zip(pending, buffer):
+                    normalize_into(pixels, row)
+                predictions = run_inference(buffer[:len(pending)])
+            
+            for (i, key, phash, near_match, _), probs in zip(pending, predictions):
+                results[i] = {'index': i, 'success': True, **format_prediction(probs)}
+                if key:
+                    store_prediction(key, probs, phash)
+                    results[i]['cache'] = 'miss'
+                if near_match is not None:
+                    results[i]['near_duplicate_distance'] = near_match[1]
+            pending.clear()
         
-        return jsonify({
+        for i, (name, image_bytes) in enumerate(items):
+            if isinstance(image_bytes, Exception):
+                results[i] = {'index': i, 'success': False, 'error': str(image_bytes)}
+                continue
+            
+            key = cache_key(image_bytes)
+            cached_probs = cached_prediction(key)
+            if cached_probs is not None:
+                results[i] = {'index': i, 'success': True, 'cache': 'hit', **format_prediction(cached_probs)}
+                continue
+            
+            check_deadline('before_decode', g.deadline)
+            try:
+                pixels = decode_image(image_bytes)
+            except Exception as e:
+                results[i] = {'index': i, 'success': False, 'error': str(e)}
+                continue
+            
+            phash, near_match = find_near_duplicate(pixels)
+            if near_match is not None and NEAR_DUPLICATE_POLICY == 'reuse':
+                probs, distance = near_match
+                results[i] = {
+                    'index': i, 'success': True, 'cache': 'near_duplicate',
+                    'near_duplicate_distance': distance, **format_prediction(probs)
+                }
+                store_prediction(key, probs, phash)
+                continue
+            
+            pending.append((i, key, phash, near_match, pixels))
+            if len(pending) >= PREDICT_BATCH_CHUNK_SIZE:
+                run_chunk()
+        
+        if pending:
+            run_chunk()
+        
+        # Echo uploaded filenames so clients can match results to slices
+        for i, (name, _) in enumerate(items):
+            if name:
+                results[i]['filename'] = name
+        
+        response = {
             'success': True,
-            'prediction': predicted_class,
-            'confidence': round(confidence, 2),
-            'probabilities': probabilities
-        })
+            'count': len(results),
+            'results': results
+        }
+        if DEMO_MODE:
+            response['demo_mode'] = True
+        return jsonify(response)
         
+    except DeadlineExceeded as e:
+        return jsonify({'error': str(e)}), 504
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -239,6 +817,126 @@ IMPORTANT GUIDELINES:
 You are integrated into the NeuroScan AI brain tumor classification application."""
 
 
+def chat_headers():
+    """Return the OpenRouter request headers."""
+    return {
+        'Authorization': f'Bearer {OPENROUTER_API_KEY}',
+        'Content-Type': 'application/json',
+        'HTTP-Referer': 'https://neuroscan-ai.app',
+        'X-Title': 'NeuroScan AI'
+    }
+
+
+def chat_payload(user_message, stream=False):
+    """Return the OpenRouter chat completion request for one user message."""
+    payload = {
+        'model': OPENROUTER_MODEL,
+        'messages': [
+            {'role': 'system', 'content': CHATBOT_SYSTEM_PROMPT},
+            {'role': 'user', 'content': user_message}
+        ],
+        'max_tokens': 500,
+        'temperature': 0.7
+    }
+    if stream:
+        payload['stream'] = True
+    return payload
+
+
+def upstream_error_message(body):
+    """Extract the error message from an OpenRouter error response body."""
+    try:
+        return json.loads(body).get('error', {}).get('message', 'Unknown error')
+    except (ValueError, AttributeError):
+        return 'Unknown error'
+
+
+def parse_stream_line(line):
+    """Return (token, done) for one line of a streamed chat completion.
+    
+    The upstream stream is itself Server-Sent Events: ``data: {chunk}`` lines
+    carrying ``choices[0].delta.content``, keep-alive comments and blank
+    separators, ending with ``data: [DONE]``.
+    """
+    if not line.startswith('data:'):
+        return None, False
+    
+    data = line[len('data:'):].strip()
+    if data == '[DONE]':
+        return None, True
+    
+    chunk = json.loads(data)
+    if 'error' in chunk:
+        raise UpstreamError(chunk['error'].get('code', 500), data)
+    choices = chunk.get('choices') or [{}]
+    return choices[0].get('delta', {}).get('content') or None, False
+
+
+def sse_event(data, event=None):
+    """Format one Server-Sent Event with a JSON payload."""
+    prefix = f'event: {event}\n' if event else ''
+    return f'{prefix}data: {json.dumps(data)}\n\n'
+
+
+def record_chat_stream(ttft_seconds, failed=False):
+    """Record one streamed reply's time to first token (None if none arrived)."""
+    with _chat_stream_stats_lock:
+        _chat_stream_stats['streams'] += 1
+        if failed:
+            _chat_stream_stats['errors'] += 1
+        if ttft_seconds is not None:
+            _chat_stream_stats['first_tokens'] += 1
+            _chat_stream_stats['total_ttft'] += ttft_seconds
+            _chat_stream_stats['last_ttft_ms'] = round(ttft_seconds * 1000, 3)
+
+
+def chat_stream_error(e, ttft):
+    """Record a failed stream and return its SSE ``error`` event (same fields as /chat)."""
+    record_chat_stream(ttft, failed=True)
+    
+    if isinstance(e, UpstreamTimeout):
+        payload = {'error': 'Request timeout', 'response': 'The request took too long. Please try again.'}
+    elif isinstance(e, UpstreamError):
+        error_msg = upstream_error_message(e.body)
+        print(f"OpenRouter API error: {e.status_code} - {error_msg}")
+        payload = {
+            'error': f'API error: {e.status_code}',
+            'response': f'API Error: {error_msg}. Please try again later.'
+        }
+    else:
+        payload = {'error': str(e), 'response': 'An error occurred. Please try again.'}
+    return sse_event(payload, event='error')
+
+
+def chat_stream_done(start, ttft):
+    """Record a finished stream and return its SSE ``done`` event."""
+    record_chat_stream(ttft)
+    return sse_event({
+        'ttft_ms': round(ttft * 1000, 3) if ttft is not None else None,
+        'total_ms': round((time.perf_counter() - start) * 1000, 3)
+    }, event='done')
+
+
+# Sent instead of a stream when no OpenRouter API key is set
+CHAT_NOT_CONFIGURED_EVENT = sse_event({
+    'error': 'Chatbot not configured. Please set OPENROUTER_API_KEY environment variable.',
+    'response': 'I apologize, but the chatbot is not configured yet. Please add your OpenRouter API key to enable this feature.'
+}, event='error')
+
+
+def chat_stream_stats():
+    """Return streamed-chat counts and time-to-first-token latency."""
+    with _chat_stream_stats_lock:
+        stats = dict(_chat_stream_stats)
+    
+    return {
+        'streams': stats['streams'],
+        'errors': stats['errors'],
+        'last_ttft_ms': stats['last_ttft_ms'],
+        'avg_ttft_ms': round(stats['total_ttft'] / stats['first_tokens'] * 1000, 3) if stats['first_tokens'] else None,
+    }
+
+
 @app.route('/chat', methods=['POST'])
 def chat():
     """Handle chatbot messages using OpenRouter API."""
@@ -256,30 +954,11 @@ def chat():
                 'response': 'I apologize, but the chatbot is not configured yet. Please add your OpenRouter API key to enable this feature.'
             }), 200
         
-        # Prepare the API request
-        headers = {
-            'Authorization': f'Bearer {OPENROUTER_API_KEY}',
-            'Content-Type': 'application/json',
-            'HTTP-Referer': 'https://neuroscan-ai.app',
-            'X-Title': 'NeuroScan AI'
-        }
-        
-        payload = {
-            'model': OPENROUTER_MODEL,
-            'messages': [
-                {'role': 'system', 'content': CHATBOT_SYSTEM_PROMPT},
-                {'role': 'user', 'content': user_message}
-            ],
-            'max_tokens': 500,
-            'temperature': 0.7
-        }
-        
-        # Make the API request
-        response = requests.post(
+        # Make the API request over a pooled keep-alive connection
+        response = chat_http.post(
             OPENROUTER_API_URL,
-            headers=headers,
-            json=payload,
-            timeout=30
+            headers=chat_headers(),
+            json=chat_payload(user_message)
         )
         
         if response.status_code != 200:
@@ -299,7 +978,7 @@ def chat():
             'response': assistant_message
         })
         
-    except requests.Timeout:
+    except UpstreamTimeout:
         return jsonify({
             'error': 'Request timeout',
             'response': 'The request took too long. Please try again.'
@@ -311,15 +990,82 @@ def chat():
         }), 200
 
 
+def health_report():
+    """Return the /health status fields (shared with the ASGI app)."""
+    return {
+        'status': 'healthy',
+        'demo_mode': DEMO_MODE,
+        'model_backend': MODEL_BACKEND,
+        'model_loaded': backend is not None,
+        # The backend is published only after warm-up, so loaded means ready
+        'ready': backend is not None,
+        'warmup': warmup_report,
+        'inference': inference_stats(),
+        'chatbot_configured': bool(OPENROUTER_API_KEY),
+        'chat_upstream': chat_http.describe(),
+        'chat_streaming': chat_stream_stats(),
+        'batching': batcher.stats() if batcher is not None else None,
+        'admission': admission.stats() if admission is not None else None,
+        'deadlines': deadline_stats(),
+        'result_cache': result_cache.stats() if result_cache is not None else None,
+        'prediction_store': prediction_store.stats() if prediction_store is not None else None,
+        'near_duplicates': (
+            {'policy': NEAR_DUPLICATE_POLICY, **near_duplicates.stats()} if near_duplicates is not None else None
+        )
+    }
+
+
+@app.route('/chat/stream', methods=['POST'])
+def chat_stream():
+    """Relay a streamed OpenRouter completion to the browser as Server-Sent Events.
+    
+    Emits one ``data: {"token": ...}`` event per chunk as it arrives, then a
+    ``done`` event with the time to first token, or an ``error`` event with the
+    same ``error``/``response`` fields as /chat.
+    """
+    data = request.get_json(silent=True) or {}
+    user_message = data.get('message', '').strip()
+    
+    if not user_message:
+        return jsonify({'error': 'No message provided'}), 400
+    
+    def generate():
+        if not OPENROUTER_API_KEY:
+            yield CHAT_NOT_CONFIGURED_EVENT
+            return
+        
+        start = time.perf_counter()
+        ttft = None
+        try:
+            for line in chat_http.stream_lines(
+                OPENROUTER_API_URL, headers=chat_headers(), json=chat_payload(user_message, stream=True)
+            ):
+                token, done = parse_stream_line(line)
+                if done:
+                    break
+                if token:
+                    if ttft is None:
+                        ttft = time.perf_counter() - start
+                    yield sse_event({'token': token})
+        except Exception as e:
+            yield chat_stream_error(e, ttft)
+            return
+        
+        yield chat_stream_done(start, ttft)
+    
+    # Disable proxy buffering so each token reaches the browser immediately
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
 @app.route('/health')
 def health():
     """Health check endpoint."""
-    return jsonify({
-        'status': 'healthy',
-        'demo_mode': DEMO_MODE,
-        'model_loaded': model is not None,
-        'chatbot_configured': bool(OPENROUTER_API_KEY)
-    })
+    return jsonify(health_report())
+
+
+if EAGER_LOAD and __name__ != '__main__':
+    load_model()
 
 
 if __name__ == '__main__':
@@ -338,6 +1084,7 @@ if __name__ == '__main__':
         except Exception as e:
             print(f"\n❌ Model loading failed. Switching to DEMO mode.")
             DEMO_MODE = True
+            MODEL_BACKEND = 'demo'
     
     print("\n" + "="*60)
     print("  Server ready! Open http://localhost:5001 in your browser")
@@ -0,0 +1,254 @@
+"""Asyncio (ASGI) variant of the NeuroScan AI server.
+
+    hypercorn asgi_app:app --bind 0.0.0.0:5001
+
+Serves the same /, /predict, /chat, /chat/stream and /health routes as app.py and reuses its
+configuration, model loading, caches, admission control and micro-batcher.
+Request bodies and the OpenRouter call are awaited on the event loop (httpx),
+so an idle chat or a slow upload costs a coroutine instead of a worker
+thread. Decoding and inference are CPU-bound and run on a bounded thread pool.
+"""
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+from quart import Quart, jsonify, make_response, render_template, request
+
+import app as core
+from batching import DeadlineExceeded
+from http_pool import UpstreamError, UpstreamTimeout, http2_available
+
+# Threads decoding images and waiting on the micro-batcher. Twice the batch
+# size lets the next batch fill while the current one runs.
+ASGI_EXECUTOR_WORKERS = int(os.environ.get('ASGI_EXECUTOR_WORKERS', str(2 * core.BATCH_MAX_SIZE)))
+
+# Concurrent OpenRouter requests; beyond this chats wait for a free connection
+CHAT_MAX_CONNECTIONS = int(os.environ.get('CHAT_MAX_CONNECTIONS', '1000'))
+
+app = Quart(__name__)
+app.config['MAX_CONTENT_LENGTH'] = core.app.config['MAX_CONTENT_LENGTH']
+
+executor = ThreadPoolExecutor(max_workers=ASGI_EXECUTOR_WORKERS, thread_name_prefix='predict')
+
+# Created on the serving event loop
+chat_client = None
+
+
+def run_in_executor(fn, *args):
+    """Run a blocking call on the bounded pool and await its result."""
+    return asyncio.wrap_future(executor.submit(fn, *args))
+
+
+@app.before_serving
+async def start_chat_client():
+    global chat_client
+    chat_client = httpx.AsyncClient(
+        http2=core.CHAT_HTTP2 and http2_available(),
+        timeout=httpx.Timeout(core.CHAT_READ_TIMEOUT, connect=core.CHAT_CONNECT_TIMEOUT),
+        limits=httpx.Limits(
+            max_connections=CHAT_MAX_CONNECTIONS,
+            max_keepalive_connections=core.CHAT_POOL_SIZE if core.CHAT_KEEP_ALIVE else 0
+        )
+    )
+
+
+@app.after_serving
+async def stop_chat_client():
+    await chat_client.aclose()
+    executor.shutdown(wait=False)
+
+
+async def classify_demo(image_bytes, deadline):
+    """Demo-mode /predict: await the simulated latency instead of blocking a thread.
+
+    Only the decode runs on the executor, so load tests measure the HTTP
+    layer rather than ASGI_EXECUTOR_WORKERS. The micro-batcher and
+    DEMO_PARALLELISM do not apply on this path.
+    """
+    demo = core.backend
+    core.check_deadline('before_decode', deadline)
+    await run_in_executor(core.decode_image, image_bytes)
+    core.check_deadline('before_enqueue', deadline)
+
+    start = time.perf_counter()
+    await asyncio.sleep(demo.simulated_latency_ms(1) / 1000)
+    probs = demo.simulated_outputs(1)[0]
+    core.record_inference(1, time.perf_counter() - start)
+    return {'success': True, **core.format_prediction(probs), 'demo_mode': True}
+
+
+async def read_upload():
+    """Return (image_bytes, error) from a raw, multipart or base64 JSON /predict body."""
+    if request.mimetype == 'application/octet-stream' or request.mimetype.startswith('image/'):
+        image_bytes = await request.get_data(cache=False)
+        return (image_bytes, None) if image_bytes else (None, 'No image provided')
+
+    files = await request.files
+    if 'image' in files:
+        file = files['image']
+        if file.filename == '':
+            return None, 'No image selected'
+        return file.read(), None
+
+    data = await request.get_json(silent=True)
+    if data and 'image' in data:
+        # Base64 decoding of a large upload is CPU work; keep it off the event loop
+        return await run_in_executor(core.decode_base64_image, data['image']), None
+    return None, 'No image provided'
+
+
+@app.route('/')
+async def index():
+    """Render the main page."""
+    return await render_template('index.html')
+
+
+@app.route('/predict', methods=['POST'])
+async def predict():
+    """Handle image upload and return prediction (same contract as app.py)."""
+    try:
+        deadline = core.request_deadline(request.headers)
+    except ValueError:
+        return jsonify({'error': 'Invalid X-Request-Timeout-Ms header'}), 400
+
+    admission = core.admission
+    if admission is not None and not admission.try_acquire():
+        retry_after = admission.retry_after()
+        return (
+            jsonify({'error': 'Server is busy, please retry later', 'retry_after': retry_after}),
+            429,
+            {'Retry-After': str(retry_after)}
+        )
+
+    try:
+        image_bytes, error = await read_upload()
+        if error:
+            return jsonify({'error': error}), 400
+
+        # Once demo mode is loaded, simulate inference on the event loop
+        if core.DEMO_MODE and core.backend is not None:
+            return jsonify(await classify_demo(image_bytes, deadline))
+        return jsonify(await run_in_executor(core.classify_image, image_bytes, deadline))
+
+    except DeadlineExceeded as e:
+        return jsonify({'error': str(e)}), 504
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    finally:
+        if admission is not None:
+            admission.release()
+
+
+@app.route('/chat', methods=['POST'])
+async def chat():
+    """Handle chatbot messages using OpenRouter API without blocking a thread."""
+    try:
+        data = await request.get_json()
+        user_message = data.get('message', '').strip()
+
+        if not user_message:
+            return jsonify({'error': 'No message provided'}), 400
+
+        if not core.OPENROUTER_API_KEY:
+            return jsonify({
+                'error': 'Chatbot not configured. Please set OPENROUTER_API_KEY environment variable.',
+                'response': 'I apologize, but the chatbot is not configured yet. Please add your OpenRouter API key to enable this feature.'
+            }), 200
+
+        response = await chat_client.post(
+            core.OPENROUTER_API_URL,
+            headers=core.chat_headers(),
+            json=core.chat_payload(user_message)
+        )
+
+        if response.status_code != 200:
+            error_detail = response.json() if response.text else {}
+            error_msg = error_detail.get('error', {}).get('message', 'Unknown error')
+            print(f"OpenRouter API error: {response.status_code} - {error_msg}")
+            return jsonify({
+                'error': f'API error: {response.status_code}',
+                'response': f'API Error: {error_msg}. Please try again later.'
+            }), 200
+
+        result = response.json()
+        return jsonify({
+            'success': True,
+            'response': result['choices'][0]['message']['content']
+        })
+
+    except httpx.TimeoutException:
+        return jsonify({
+            'error': 'Request timeout',
+            'response': 'The request took too long. Please try again.'
+        }), 200
+    except Exception as e:
+        return jsonify({
+            'error': str(e),
+            'response': 'An error occurred. Please try again.'
+        }), 200
+
+
+@app.route('/chat/stream', methods=['POST'])
+async def chat_stream():
+    """Relay a streamed OpenRouter completion as Server-Sent Events (same events as app.py)."""
+    data = await request.get_json(silent=True) or {}
+    user_message = data.get('message', '').strip()
+
+    if not user_message:
+        return jsonify({'error': 'No message provided'}), 400
+
+    async def generate():
+        # ASGI response bodies are bytes
+        if not core.OPENROUTER_API_KEY:
+            yield core.CHAT_NOT_CONFIGURED_EVENT.encode()
+            return
+
+        start = time.perf_counter()
+        ttft = None
+        try:
+            async with chat_client.stream(
+                'POST', core.OPENROUTER_API_URL,
+                headers=core.chat_headers(), json=core.chat_payload(user_message, stream=True)
+            ) as response:
+                if response.status_code != 200:
+                    raise UpstreamError(response.status_code, (await response.aread()).decode(errors='replace'))
+
+                async for line in response.aiter_lines():
+                    token, done = core.parse_stream_line(line)
+                    if done:
+                        break
+                    if token:
+                        if ttft is None:
+                            ttft = time.perf_counter() - start
+                        yield core.sse_event({'token': token}).encode()
+        except httpx.TimeoutException as e:
+            yield core.chat_stream_error(UpstreamTimeout(str(e)), ttft).encode()
+            return
+        except Exception as e:
+            yield core.chat_stream_error(e, ttft).encode()
+            return
+
+        yield core.chat_stream_done(start, ttft).encode()
+
+    response = await make_response(
+        generate(), 200,
+        {'Content-Type': 'text/event-stream', 'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+    # A long completion must not hit Quart's default response timeout
+    response.timeout = None
+    return response
+
+
+@app.route('/health')
+async def health():
+    """Health check endpoint."""
+    return jsonify({
+        **core.health_report(),
+        'server': {'type': 'asgi', 'executor_workers': ASGI_EXECUTOR_WORKERS},
+    })
+
+
+if __name__ == '__main__':
+    app.run(host='0.0.0.0', port=5001)
@@ -0,0 +1,509 @@
+"""Inference backends for the NeuroScan classifier.
+
+Every backend exposes the same contract: ``load()`` once, then
+``predict_batch(batch)`` with a float32 (N, 299, 299, 3) array returns an
+(N, len(class_labels)) array of class probabilities. Backends register
+themselves by name so the server, benchmarks and tools can pick one from
+configuration without knowing how it is implemented.
+"""
+import collections
+import contextlib
+import os
+import random
+import threading
+import time
+
+import numpy as np
+
+BACKENDS = {}
+
+
+def register_backend(name):
+    """Class decorator adding a backend to the registry under `name`."""
+    def decorator(cls):
+        cls.name = name
+        BACKENDS[name] = cls
+        return cls
+    return decorator
+
+
+def create_backend(name, class_labels, **options):
+    """Instantiate the backend registered under `name` (not yet loaded)."""
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown inference backend '{name}'. Available: {', '.join(sorted(BACKENDS))}")
+    return BACKENDS[name](class_labels, **options)
+
+
+def import_tensorflow(intra_op_threads=0, inter_op_threads=0):
+    """Import TensorFlow once, with GPU memory growth enabled.
+
+    Non-zero thread counts size TensorFlow's intra-op and inter-op pools (0
+    keeps its default of one thread per core). They only take effect before
+    the TensorFlow runtime is first initialized in this process.
+    """
+    os.environ.setdefault('TF_CPP_MIN_LOG_LEVEL', '2')
+    import tensorflow as tf
+
+    try:
+        if intra_op_threads:
+            tf.config.threading.set_intra_op_parallelism_threads(intra_op_threads)
+        if inter_op_threads:
+            tf.config.threading.set_inter_op_parallelism_threads(inter_op_threads)
+    except RuntimeError as e:
+        print(f"TensorFlow thread configuration error: {e}")
+
+    # Configure GPU memory growth to avoid OOM errors
+    gpus = tf.config.experimental.list_physical_devices('GPU')
+    if gpus:
+        try:
+            for gpu in gpus:
+                tf.config.experimental.set_memory_growth(gpu, True)
+        except RuntimeError as e:
+            print(f"GPU configuration error: {e}")
+    return tf
+
+
+class InferenceBackend:
+    """Base class: subclasses implement load() and predict_batch()."""
+
+    name = None
+    supported_precisions = ('float32',)
+    # Suggestions appended to the error for precisions served by another backend
+    precision_hints = {}
+    # Whether a warm-up pass at startup makes the first real request faster
+    needs_warmup = True
+    # Whether runtime state (and so warm-up) is kept per calling thread
+    thread_local_state = False
+
+    def __init__(self, class_labels, precision='float32', model_path=None):
+        if precision not in self.supported_precisions:
+            hint = self.precision_hints.get(precision)
+            raise ValueError(
+                f"MODEL_PRECISION={precision} is not supported by the {self.name} backend"
+                + (f"; {hint}" if hint else '')
+            )
+        self.class_labels = list(class_labels)
+        self.precision = precision
+        self.model_path = model_path
+
+    def preload(self):
+        """Do the fork-safe part of loading before a pre-fork server forks.
+
+        Runs in the server master; load() then finishes in each worker. Only
+        plain file reads belong here: runtimes that start thread pools
+        (TensorFlow, ONNX Runtime) must not be initialized before fork.
+        """
+
+    def load(self):
+        """Load the model; called once before the first predict_batch."""
+        raise NotImplementedError
+
+    def predict_batch(self, batch):
+        """Return class probabilities for a float32 (N, H, W, C) batch."""
+        raise NotImplementedError
+
+    def release_thread_state(self):
+        """Free runtime state held for the calling thread, if the backend keeps any."""
+
+    def _check_output_classes(self, num_classes):
+        if num_classes != len(self.class_labels):
+            raise ValueError(
+                f"{self.name} model outputs {num_classes} classes, expected {len(self.class_labels)}"
+            )
+
+    def describe(self):
+        """Return a JSON-serializable summary for /health."""
+        return {
+            'name': self.name,
+            'precision': self.precision,
+            'model_path': os.path.basename(self.model_path) if self.model_path else None,
+        }
+
+
+@register_backend('keras')
+class KerasBackend(InferenceBackend):
+    """Plain Keras model.predict (legacy tf_keras when installed)."""
+
+    # mixed_float16 is slow on CPU and is not the float16-weight model, so
+    # float16 is only served from a converted TFLite file
+    supported_precisions = ('float32', 'bfloat16')
+    precision_hints = {
+        'float16': 'export a float16 model with convert_model.py --quantize float16 and use MODEL_BACKEND=tflite',
+    }
+
+    def __init__(self, class_labels, precision='float32', model_path=None,
+                 intra_op_threads=0, inter_op_threads=0):
+        super().__init__(class_labels, precision, model_path)
+        self.intra_op_threads = intra_op_threads
+        self.inter_op_threads = inter_op_threads
+        self.model = None
+
+    def load(self):
+        self.tf = import_tensorflow(self.intra_op_threads, self.inter_op_threads)
+        print(f"Using model: {self.model_path}")
+
+        try:
+            # Use tf_keras (legacy Keras 2.x) for loading old format models
+            import tf_keras as keras
+            self.model = keras.models.load_model(self.model_path, compile=False)
+            print("Model loaded successfully using tf_keras!")
+        except ImportError:
+            print("tf_keras not installed. Trying standard TensorFlow...")
+            try:
+                keras = self.tf.keras
+                self.model = keras.models.load_model(self.model_path, compile=False)
+                print("Model loaded successfully!")
+            except Exception as e:
+                print(f"Error loading model: {e}")
+                raise e
+        except Exception as e:
+            print(f"Error loading model: {e}")
+            print("\n" + "="*60)
+            print("MODEL LOADING FAILED")
+            print("="*60)
+            print("This is likely due to Keras 2.x vs 3.x incompatibility.")
+            print("\nOptions:")
+            print("1. Run in DEMO mode: Set DEMO_MODE=true environment variable")
+            print("2. Install TensorFlow 2.15: pip install tensorflow==2.15.0")
+            print("3. Convert the model using convert_model.py")
+            print("="*60 + "\n")
+            raise e
+
+        self._check_output_classes(self.model.output_shape[-1])
+
+        if self.precision != 'float32':
+            from convert_model import with_precision_policy
+            print(f"Switching model to the mixed_{self.precision} policy...")
+            self.model = with_precision_policy(keras, self.model, f'mixed_{self.precision}')
+
+    def predict_batch(self, batch):
+        return self.model.predict(batch, verbose=0)
+
+    def describe(self):
+        return {
+            **super().describe(),
+            'intra_op_threads': self.intra_op_threads,
+            'inter_op_threads': self.inter_op_threads,
+        }
+
+
+@register_backend('compiled')
+class CompiledBackend(KerasBackend):
+    """Keras model called through fixed-signature tf.functions.
+
+    ``model.predict`` builds a data adapter and iterator on every call, which
+    dominates the cost of a single 299x299 image. Here one concrete function
+    per batch size 1..max_batch_size is traced up front and called directly;
+    larger batches are sliced.
+    """
+
+    def __init__(self, class_labels, precision='float32', model_path=None,
+                 intra_op_threads=0, inter_op_threads=0, max_batch_size=8):
+        super().__init__(class_labels, precision, model_path, intra_op_threads, inter_op_threads)
+        self.max_batch_size = max(1, int(max_batch_size))
+        self._functions = {}
+
+    def load(self):
+        super().load()
+        tf = self.tf
+        keras_model = self.model
+        input_shape = tuple(keras_model.input_shape[1:])
+
+        print(f"Tracing inference functions for batch sizes 1..{self.max_batch_size}...")
+        forward = tf.function(lambda x: keras_model(x, training=False))
+        self._functions = {
+            size: forward.get_concrete_function(
+                tf.TensorSpec((size,) + input_shape, tf.float32)
+            )
+            for size in range(1, self.max_batch_size + 1)
+        }
+
+    def predict_batch(self, batch):
+        outputs = []
+        for start in range(0, len(batch), self.max_batch_size):
+            chunk = batch[start:start + self.max_batch_size]
+            result = self._functions[len(chunk)](self.tf.constant(chunk, dtype=self.tf.float32))
+            outputs.append(result.numpy())
+        return np.concatenate(outputs)
+
+    def describe(self):
+        return {**super().describe(), 'max_traced_batch': self.max_batch_size}
+
+
+@register_backend('tflite')
+class TFLiteBackend(InferenceBackend):
+    """Serve a .tflite model exported by convert_model.py.
+
+    The flatbuffer is read once and shared. Batches are zero-padded to the
+    next power of two, and each worker thread keeps up to ``max_interpreters``
+    interpreters, one per padded size, so the micro-batcher's sizes 1..8 need
+    four allocations instead of a re-plan whenever the size changes. When
+    preloaded in a pre-fork master, the flatbuffer pages are shared
+    copy-on-write by every worker process.
+    """
+
+    supported_precisions = ('float32', 'float16', 'int8')
+    thread_local_state = True
+
+    def __init__(self, class_labels, precision='float32', model_path=None, num_threads=None,
+                 max_interpreters=4):
+        super().__init__(class_labels, precision, model_path)
+        self.num_threads = num_threads
+        self.max_interpreters = max(1, int(max_interpreters))
+        self._local = threading.local()
+        self._model_content = None
+
+    def preload(self):
+        print(f"Reading TFLite model: {self.model_path}")
+        with open(self.model_path, 'rb') as f:
+            self._model_content = f.read()
+
+    def load(self):
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            Interpreter = import_tensorflow().lite.Interpreter
+
+        print(f"Loading TFLite model: {self.model_path}")
+        self._interpreter_cls = Interpreter
+        if self._model_content is None:
+            self.preload()
+
+        # Build one interpreter now so a bad file fails at load time
+        self._check_output_classes(self._get_interpreter(1)['output']['shape'][-1])
+        print("TFLite model loaded successfully!")
+
+    @staticmethod
+    def _bucket(batch_size):
+        """Round a batch size up to the next power of two."""
+        return 1 << (batch_size - 1).bit_length()
+
+    def _get_interpreter(self, bucket):
+        """Return this thread's interpreter state, allocated for a bucket-sized batch.
+
+        At most ``max_interpreters`` are kept per thread. Past that the least
+        recently used one is resized for the new bucket rather than building
+        another, so its weights are reused and memory stays bounded.
+        """
+        interpreters = getattr(self._local, 'interpreters', None)
+        if interpreters is None:
+            interpreters = self._local.interpreters = collections.OrderedDict()
+
+        state = interpreters.get(bucket)
+        if state is not None:
+            interpreters.move_to_end(bucket)
+            return state
+
+        if len(interpreters) >= self.max_interpreters:
+            _, state = interpreters.popitem(last=False)
+            interpreter = state['interpreter']
+        else:
+            interpreter = self._interpreter_cls(
+                model_content=self._model_content, num_threads=self.num_threads
+            )
+        input_details = interpreter.get_input_details()[0]
+        input_shape = list(input_details['shape'])
+        input_shape[0] = bucket
+        interpreter.resize_tensor_input(input_details['index'], input_shape)
+        interpreter.allocate_tensors()
+        state = {
+            'interpreter': interpreter,
+            'input': interpreter.get_input_details()[0],
+            'output': interpreter.get_output_details()[0],
+        }
+        interpreters[bucket] = state
+        return state
+
+    def release_thread_state(self):
+        self._local.interpreters = collections.OrderedDict()
+
+    def predict_batch(self, batch):
+        batch = np.asarray(batch, dtype=np.float32)
+        rows = len(batch)
+        bucket = self._bucket(rows)
+        if bucket != rows:
+            # Zero rows fill the bucket; their outputs are dropped below
+            padded = np.zeros((bucket,) + batch.shape[1:], dtype=np.float32)
+            padded[:rows] = batch
+            batch = padded
+
+        state = self._get_interpreter(bucket)
+        interpreter = state['interpreter']
+        interpreter.set_tensor(state['input']['index'], batch)
+        interpreter.invoke()
+        return interpreter.get_tensor(state['output']['index'])[:rows].copy()
+
+    def describe(self):
+        return {
+            **super().describe(),
+            'num_threads': self.num_threads,
+            'max_interpreters_per_thread': self.max_interpreters,
+        }
+
+
+@register_backend('onnx')
+class OnnxBackend(InferenceBackend):
+    """Serve a .onnx model exported by convert_model.py with ONNX Runtime."""
+
+    def __init__(self, class_labels, precision='float32', model_path=None,
+                 intra_op_threads=0, inter_op_threads=0):
+        super().__init__(class_labels, precision, model_path)
+        self.intra_op_threads = intra_op_threads
+        self.inter_op_threads = inter_op_threads
+
+    def load(self):
+        import onnxruntime as ort
+
+        print(f"Loading ONNX model: {self.model_path}")
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        # 0 lets ONNX Runtime pick its default thread count
+        options.intra_op_num_threads = self.intra_op_threads
+        options.inter_op_num_threads = self.inter_op_threads
+        if self.inter_op_threads > 1:
+            options.execution_mode = ort.ExecutionMode.ORT_PARALLEL
+
+        # No preload(): ONNX Runtime copies the weights into each session,
+        # so bytes read before fork would not be shared anyway
+        self._session = ort.InferenceSession(
+            self.model_path, sess_options=options, providers=['CPUExecutionProvider']
+        )
+        self._input_name = self._session.get_inputs()[0].name
+        self._check_output_classes(self._session.get_outputs()[0].shape[-1])
+        print("ONNX model loaded successfully!")
+
+    def predict_batch(self, batch):
+        # InferenceSession.run is thread-safe, so one session serves all threads
+        feed = {self._input_name: np.asarray(batch, dtype=np.float32)}
+        return self._session.run(None, feed)[0]
+
+    def describe(self):
+        return {
+            **super().describe(),
+            'intra_op_threads': self.intra_op_threads,
+            'inter_op_threads': self.inter_op_threads,
+        }
+
+
+@register_backend('demo')
+class DemoBackend(InferenceBackend):
+    """Simulated predictions for UI testing and load tests without a model.
+
+    Each batch takes a simulated latency drawn from ``latency_distribution``:
+
+    - ``fixed``: always ``latency_ms``
+    - ``normal``: ``latency_ms`` +/- ``latency_stddev_ms`` (never below zero)
+    - ``replay``: sampled from a trace file recorded from a real backend, one
+      ``latency_ms`` or ``batch_size,latency_ms`` line per call (see
+      ``benchmark.py inference --trace-output``)
+
+    ``per_item_ms`` is added for every image after the first, so larger
+    batches cost more but less per image, as on a real model. Waiting is a
+    plain sleep, so concurrent calls overlap; a non-zero ``parallelism``
+    caps how many batches run at once, like a model busy with one forward
+    pass. The micro-batcher already runs one batch at a time, so the cap
+    only matters for unbatched and /predict/batch calls. The sleep still
+    holds the calling thread; asgi_app.py awaits ``simulated_latency_ms()``
+    on its event loop instead.
+    """
+
+    needs_warmup = False
+    latency_distributions = ('fixed', 'normal', 'replay')
+
+    def __init__(self, class_labels, precision='float32', model_path=None, latency_ms=500,
+                 latency_distribution='fixed', latency_stddev_ms=0.0, latency_trace=None,
+                 per_item_ms=0.0, parallelism=0):
+        super().__init__(class_labels, precision, model_path)
+        if latency_distribution not in self.latency_distributions:
+            raise ValueError(
+                f"Unknown demo latency distribution '{latency_distribution}'. "
+                f"Available: {', '.join(self.latency_distributions)}"
+            )
+        if latency_distribution == 'replay' and not latency_trace:
+            raise ValueError("The 'replay' demo latency distribution needs a latency trace file")
+
+        self.latency_ms = latency_ms
+        self.latency_distribution = latency_distribution
+        self.latency_stddev_ms = latency_stddev_ms
+        self.latency_trace = latency_trace
+        self.per_item_ms = per_item_ms
+        # 0 (or None) leaves concurrent batches unlimited
+        self.parallelism = max(0, int(parallelism or 0))
+        self._slots = threading.Semaphore(self.parallelism) if self.parallelism else contextlib.nullcontext()
+        self._trace = {}
+
+    def load(self):
+        print("DEMO MODE: Skipping model loading")
+        if self.latency_distribution == 'replay':
+            self._trace = self._read_trace(self.latency_trace)
+            print(f"Replaying {sum(len(v) for v in self._trace.values())} recorded latencies "
+                  f"from {self.latency_trace}")
+
+    @staticmethod
+    def _read_trace(path):
+        """Return recorded latencies grouped by batch size (None when not recorded)."""
+        trace = {}
+        with open(path) as f:
+            for line in f:
+                fields = [field.strip() for field in line.split(',')]
+                if not fields[0] or fields[0].startswith('#'):
+                    continue
+                size, latency = (None, fields[0]) if len(fields) == 1 else (int(fields[0]), fields[1])
+                trace.setdefault(size, []).append(float(latency))
+
+        if not trace:
+            raise ValueError(f"Latency trace {path} contains no samples")
+        return trace
+
+    def _replayed_latency_ms(self, batch_size):
+        if batch_size in self._trace:
+            return random.choice(self._trace[batch_size])
+        if None in self._trace:
+            # Unsized samples are single-image calls
+            return random.choice(self._trace[None]) + self.per_item_ms * (batch_size - 1)
+
+        # Scale a sample from the nearest recorded batch size
+        nearest = min(self._trace, key=lambda size: abs(size - batch_size))
+        return random.choice(self._trace[nearest]) + self.per_item_ms * (batch_size - nearest)
+
+    def simulated_latency_ms(self, batch_size):
+        """Draw the simulated latency of one batch of batch_size images."""
+        if self.latency_distribution == 'replay':
+            return max(0.0, self._replayed_latency_ms(batch_size))
+
+        latency = self.latency_ms
+        if self.latency_distribution == 'normal':
+            latency = random.gauss(self.latency_ms, self.latency_stddev_ms)
+        return max(0.0, latency + self.per_item_ms * (batch_size - 1))
+
+    def simulated_outputs(self, batch_size):
+        """Return simulated probabilities for batch_size images, without waiting."""
+        return np.array([self._simulated_probs() for _ in range(batch_size)], dtype=np.float32)
+
+    def _simulated_probs(self):
+        num_classes = len(self.class_labels)
+        probs = np.random.dirichlet(np.ones(num_classes) * 2)  # More realistic distribution
+
+        # Sometimes make one class more dominant for realistic results
+        if random.random() > 0.3:
+            dominant_idx = random.randint(0, num_classes - 1)
+            probs[dominant_idx] += 0.5
+            probs = probs / probs.sum()
+        return probs
+
+    def predict_batch(self, batch):
+        latency = self.simulated_latency_ms(len(batch))
+        with self._slots:
+            time.sleep(latency / 1000)
+        return self.simulated_outputs(len(batch))
+
+    def describe(self):
+        return {
+            **super().describe(),
+            'latency_ms': self.latency_ms,
+            'latency_distribution': self.latency_distribution,
+            'latency_stddev_ms': self.latency_stddev_ms,
+            'latency_trace': os.path.basename(self.latency_trace) if self.latency_trace else None,
+            'per_item_ms': self.per_item_ms,
+            'parallelism': self.parallelism,
+        }
@@ -0,0 +1,266 @@
+import collections
+import math
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+import numpy as np
+
+
+class DeadlineExceeded(Exception):
+    """The client stopped waiting for this request before it was served."""
+
+
+class MicroBatcher:
+    """Group single-image requests into one forward pass.
+
+    Requests are queued from the Flask worker threads. A background thread
+    takes the first waiting request, keeps collecting for up to
+    ``max_wait_ms`` (or until ``max_batch_size`` requests are waiting), runs
+    ``predict_fn`` once on the batch and hands each row of the output back to
+    the request that submitted it.
+
+    The batch is assembled in one preallocated float32 buffer: ``fill_row``
+    writes each submitted item into its row (by default a plain copy), so no
+    per-batch stacking or dtype conversion allocates new arrays.
+
+    ``warmup_fn``, if given, runs once on the worker thread before it takes
+    the first request, for runtimes that keep per-thread state.
+
+    Requests submitted with a deadline (a ``time.perf_counter()`` value) that
+    passes while they wait in the queue fail with DeadlineExceeded instead of
+    taking a row in the next batch. Expiry is checked again just before the
+    batch runs, since the first request may expire during the wait window.
+    """
+
+    def __init__(self, predict_fn, input_shape, max_batch_size=8, max_wait_ms=5.0, fill_row=None,
+                 warmup_fn=None):
+        self.predict_fn = predict_fn
+        self.warmup_fn = warmup_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.fill_row = fill_row or (lambda item, out: np.copyto(out, item))
+
+        # Only the worker thread touches the buffer, so one is enough
+        self._buffer = np.empty((self.max_batch_size,) + tuple(input_shape), dtype=np.float32)
+
+        self._queue = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self._batches = 0
+        self._items = 0
+        self._last_batch_size = 0
+        self._total_wait = 0.0
+        self._max_wait_seen = 0.0
+        self._expired = 0
+        self._expired_in_flight = 0
+
+        self._worker = threading.Thread(target=self._run, name='micro-batcher', daemon=True)
+        self._worker.start()
+
+    def submit(self, item, timeout=None, deadline=None):
+        """Queue one image for fill_row and wait for its output row.
+
+        With a deadline, waits at most until then and raises DeadlineExceeded.
+        """
+        future = Future()
+        now = time.perf_counter()
+        self._queue.put((item, future, now, deadline))
+
+        if deadline is not None:
+            remaining = max(0.0, deadline - now)
+            timeout = remaining if timeout is None else min(timeout, remaining)
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            if deadline is None or time.perf_counter() < deadline:
+                raise
+
+        # Still queued: cancel so the worker skips it
+        if future.cancel():
+            with self._stats_lock:
+                self._expired += 1
+            raise DeadlineExceeded('Request deadline passed while queued')
+        # Finished just after the timeout
+        if future.done():
+            return future.result()
+        with self._stats_lock:
+            self._expired_in_flight += 1
+        raise DeadlineExceeded('Request deadline passed while waiting for inference')
+
+    def _drop_if_expired(self, entry):
+        """Fail a queued request whose deadline has passed; return True if dropped.
+
+        Requests already cancelled by a waiter that gave up are dropped too.
+        """
+        future, deadline = entry[1], entry[3]
+        if future.cancelled():
+            return True
+        if deadline is None or time.perf_counter() < deadline:
+            return False
+
+        if future.set_running_or_notify_cancel():
+            future.set_exception(DeadlineExceeded('Request deadline passed while queued'))
+            with self._stats_lock:
+                self._expired += 1
+        return True
+
+    def _collect(self):
+        """Block for the first live request, then gather more until the window closes."""
+        first = self._queue.get()
+        while self._drop_if_expired(first):
+            first = self._queue.get()
+        batch = [first]
+        window_end = first[2] + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            remaining = window_end - time.perf_counter()
+            try:
+                if remaining > 0:
+                    entry = self._queue.get(timeout=remaining)
+                else:
+                    # Window closed: still take anything that is already waiting
+                    entry = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if not self._drop_if_expired(entry):
+                batch.append(entry)
+
+        return batch
+
+    def _run(self):
+        if self.warmup_fn is not None:
+            try:
+                self.warmup_fn()
+            except Exception as e:
+                # Requests still load and run cold
+                print(f"Micro-batcher warm-up failed: {e}")
+
+        while True:
+            # Last check before spending compute; a running future can no longer be cancelled
+            batch = [
+                entry for entry in self._collect()
+                if not self._drop_if_expired(entry) and entry[1].set_running_or_notify_cancel()
+            ]
+            if not batch:
+                continue
+            started = time.perf_counter()
+
+            try:
+                inputs = self._buffer[:len(batch)]
+                for row, (item, _, _, _) in zip(inputs, batch):
+                    self.fill_row(item, row)
+                outputs = self.predict_fn(inputs)
+            except Exception as e:
+                for _, future, _, _ in batch:
+                    future.set_exception(e)
+            else:
+                for row, (_, future, _, _) in zip(outputs, batch):
+                    future.set_result(row)
+
+            waits = [started - enqueued for _, _, enqueued, _ in batch]
+            with self._stats_lock:
+                self._batches += 1
+                self._items += len(batch)
+                self._last_batch_size = len(batch)
+                self._total_wait += sum(waits)
+                self._max_wait_seen = max(self._max_wait_seen, max(waits))
+
+    def stats(self):
+        """Return queue depth, realized batch sizes, queue wait times and expired requests."""
+        with self._stats_lock:
+            return {
+                'queue_depth': self._queue.qsize(),
+                'max_batch_size': self.max_batch_size,
+                'max_wait_ms': self.max_wait * 1000,
+                'batches': self._batches,
+                'items': self._items,
+                'last_batch_size': self._last_batch_size,
+                'avg_batch_size': round(self._items / self._batches, 2) if self._batches else 0.0,
+                'avg_wait_ms': round(self._total_wait / self._items * 1000, 3) if self._items else 0.0,
+                'peak_wait_ms': round(self._max_wait_seen * 1000, 3),
+                'expired': self._expired,
+                'expired_in_flight': self._expired_in_flight,
+            }
+
+
+class AdmissionController:
+    """Bound the number of requests the server works on at once.
+
+    Every admitted request holds an upload and, after decode, a model-sized
+    image until it finishes, so an unbounded backlog during a spike ends in
+    an OOM kill. ``try_acquire`` never waits: once ``max_in_flight`` requests
+    are in progress new ones are turned away immediately. The completion rate
+    over the last ``rate_window`` requests tells rejected clients how long the
+    current backlog will take to drain.
+    """
+
+    # A rate from a handful of near-simultaneous completions is noise; until
+    # the window holds this many samples over this many seconds there is none
+    MIN_RATE_SAMPLES = 8
+    MIN_RATE_SPAN = 1.0
+
+    def __init__(self, max_in_flight=64, rate_window=128):
+        self.max_in_flight = max(1, int(max_in_flight))
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._completions = collections.deque(maxlen=max(self.MIN_RATE_SAMPLES, rate_window))
+        self.admitted = 0
+        self.rejected = 0
+        self.peak_in_flight = 0
+
+    def try_acquire(self):
+        """Take a slot and return True, or return False if all are in use."""
+        with self._lock:
+            if self._in_flight >= self.max_in_flight:
+                self.rejected += 1
+                return False
+            self._in_flight += 1
+            self.admitted += 1
+            self.peak_in_flight = max(self.peak_in_flight, self._in_flight)
+            return True
+
+    def release(self):
+        """Free a slot taken by a successful try_acquire."""
+        with self._lock:
+            self._in_flight -= 1
+            self._completions.append(time.monotonic())
+
+    def service_rate(self):
+        """Return completed requests per second over the recent window, or None."""
+        with self._lock:
+            return self._service_rate()
+
+    def _service_rate(self):
+        if len(self._completions) < self.MIN_RATE_SAMPLES:
+            return None
+        # A rate measured before an idle gap says nothing about now
+        if time.monotonic() - self._completions[-1] > 10.0:
+            return None
+        span = self._completions[-1] - self._completions[0]
+        if span < self.MIN_RATE_SPAN:
+            return None
+        return (len(self._completions) - 1) / span
+
+    def retry_after(self):
+        """Seconds until the current backlog should have drained (at least 1)."""
+        with self._lock:
+            rate = self._service_rate()
+            backlog = self._in_flight
+        if not rate:
+            return 1
+        return max(1, math.ceil(backlog / rate))
+
+    def stats(self):
+        with self._lock:
+            rate = self._service_rate()
+            return {
+                'in_flight': self._in_flight,
+                'max_in_flight': self.max_in_flight,
+                'occupancy': round(self._in_flight / self.max_in_flight, 3),
+                'peak_in_flight': self.peak_in_flight,
+                'admitted': self.admitted,
+                'rejected': self.rejected,
+                'service_rate_per_s': round(rate, 2) if rate else None,
+            }
@@ -0,0 +1,294 @@
+"""Micro-benchmarks for the NeuroScan AI serving path.
+
+Usage:
+    python benchmark.py inference [--backends keras,compiled,tflite,onnx] [--batch-sizes 1,4,8]
+                                  [--trace-output latencies.csv]
+    python benchmark.py preprocess [--image scan.jpg] [--size 1024]
+    python benchmark.py decode [--sizes 1024,2048,4096]
+    python benchmark.py chat [--messages 200] [--concurrency 4] [--certfile cert.pem --keyfile key.pem]
+"""
+import argparse
+import io
+import json
+import multiprocessing
+import resource
+import ssl
+import statistics
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+from PIL import Image
+
+
+def time_calls(fn, iterations, warmup=3):
+    """Run fn repeatedly and return per-call latencies in milliseconds."""
+    for _ in range(warmup):
+        fn()
+
+    latencies = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def summarize(latencies):
+    """Return (p50, p99) of a latency list."""
+    ordered = sorted(latencies)
+    p99_index = min(len(ordered) - 1, int(round(0.99 * (len(ordered) - 1))))
+    return statistics.median(ordered), ordered[p99_index]
+
+
+def bench_inference(args):
+    """Run every requested backend through the same batch-size sweep."""
+    import app as server
+
+    results = {}
+    trace = []
+    for name in args.backends:
+        backend = server.create_configured_backend(name)
+        try:
+            backend.load()
+        except Exception as e:
+            print(f"Skipping backend '{name}': {e}")
+            continue
+
+        for size in args.batch_sizes:
+            batch = np.random.rand(size, 299, 299, 3).astype(np.float32)
+            latencies = time_calls(lambda: backend.predict_batch(batch), args.iterations)
+            results[name, size] = summarize(latencies)
+            if name == args.backends[0]:
+                trace.extend((size, latency) for latency in latencies)
+
+    baseline = args.backends[0]
+    print(f"\n{'backend':<10}  {'batch':>5}  {'p50':>10}  {'p99':>10}  {'img/s':>8}  {'vs ' + baseline:>10}")
+    for (name, size), (p50, p99) in results.items():
+        base = results.get((baseline, size))
+        speedup = f"{base[0] / p50:.2f}x" if base else '-'
+        print(f"{name:<10}  {size:>5}  {p50:>8.2f}ms  {p99:>8.2f}ms  {size / p50 * 1000:>8.1f}  {speedup:>10}")
+
+    if args.trace_output and trace:
+        # batch_size,latency_ms lines, replayable with DEMO_LATENCY_DISTRIBUTION=replay
+        with open(args.trace_output, 'w') as f:
+            f.writelines(f"{size},{latency:.3f}\n" for size, latency in trace)
+        print(f"\nWrote {len(trace)} {args.backends[0]} latencies to {args.trace_output}")
+
+
+def synthetic_jpeg(size, mode='RGB'):
+    """Encode a noisy size x size JPEG as a stand-in for an uploaded scan."""
+    channels = 3 if mode == 'RGB' else 1
+    pixels = np.random.randint(0, 256, (size, size, channels), dtype=np.uint8).squeeze()
+    output = io.BytesIO()
+    Image.fromarray(pixels, mode).save(output, format='JPEG', quality=90)
+    return output.getvalue()
+
+
+def load_sample(args):
+    if args.image:
+        with open(args.image, 'rb') as f:
+            return f.read()
+    return synthetic_jpeg(args.size, 'L' if getattr(args, 'grayscale', False) else 'RGB')
+
+
+def peak_allocation(fn):
+    """Return the peak bytes allocated by Python/NumPy during one call."""
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def legacy_preprocess(image_data):
+    """The original float64 pipeline, including the float32 cast TensorFlow made."""
+    image = Image.open(io.BytesIO(image_data))
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    image = image.resize((299, 299))
+    img_array = np.expand_dims(np.array(image) / 255.0, axis=0)
+    return img_array.astype(np.float32)
+
+
+def bench_preprocess(args):
+    """Compare the float64 preprocessing pipeline with pooled float32 buffers."""
+    from preprocessing import BatchBufferPool, decode_image, normalize_into
+
+    image_data = load_sample(args)
+    pool = BatchBufferPool(1, max_buffers=1)
+
+    def pooled_preprocess():
+        with pool.buffer() as buffer:
+            normalize_into(decode_image(image_data), buffer[0])
+
+    def rgb_preprocess():
+        with pool.buffer() as buffer:
+            normalize_into(decode_image(image_data, grayscale=False), buffer[0])
+
+    pipelines = [
+        ('float64 (legacy)', lambda: legacy_preprocess(image_data)),
+        ('float32 pooled', pooled_preprocess),
+    ]
+    if args.grayscale:
+        pipelines.insert(1, ('float32 via RGB', rgb_preprocess))
+
+    print(f"{'pipeline':<18}  {'p50':>10}  {'p99':>10}  {'peak alloc':>12}")
+    for label, fn in pipelines:
+        p50, p99 = summarize(time_calls(fn, args.iterations))
+        peak = peak_allocation(fn)
+        print(f"{label:<18}  {p50:>8.2f}ms  {p99:>8.2f}ms  {peak / (1024 * 1024):>9.2f} MB")
+
+
+def _decode_worker(image_data, draft, iterations):
+    """Run in a fresh process so ru_maxrss reflects only this decode path."""
+    from preprocessing import decode_image
+
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    latencies = time_calls(lambda: decode_image(image_data, draft=draft), iterations, warmup=1)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux
+    return latencies, (peak - baseline) / 1024
+
+
+def bench_decode(args):
+    """Compare full-resolution and draft-mode JPEG decode+resize on large inputs."""
+    context = multiprocessing.get_context('spawn')
+
+    print(f"{'size':>6}  {'decode':<6}  {'p50':>10}  {'p99':>10}  {'peak RSS growth':>16}")
+    for size in args.sizes:
+        image_data = synthetic_jpeg(size)
+        for label, draft in (('full', False), ('draft', True)):
+            with context.Pool(1) as pool:
+                latencies, rss_mb = pool.apply(_decode_worker, (image_data, draft, args.iterations))
+            p50, p99 = summarize(latencies)
+            print(f"{size:>6}  {label:<6}  {p50:>8.2f}ms  {p99:>8.2f}ms  {rss_mb:>13.1f} MB")
+
+
+class StandInChatHandler(BaseHTTPRequestHandler):
+    """Minimal OpenRouter stand-in: answers every POST with a canned completion."""
+
+    # HTTP/1.1 so clients can keep the connection open between messages
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        time.sleep(self.server.upstream_latency)
+
+        body = json.dumps({'choices': [{'message': {'role': 'assistant', 'content': 'Stand-in reply.'}}]}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stand_in_server(upstream_latency_ms, certfile=None, keyfile=None):
+    """Serve StandInChatHandler on a free localhost port; return (server, url)."""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StandInChatHandler)
+    server.daemon_threads = True
+    server.upstream_latency = upstream_latency_ms / 1000
+
+    scheme = 'http'
+    if certfile:
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(certfile, keyfile)
+        server.socket = context.wrap_socket(server.socket, server_side=True)
+        scheme = 'https'
+
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'{scheme}://localhost:{server.server_address[1]}/api/v1/chat/completions'
+
+
+def bench_chat(args):
+    """Compare a fresh connection per chat message with the pooled keep-alive client."""
+    import requests
+
+    from http_pool import PooledHTTPClient
+
+    server, url = start_stand_in_server(args.upstream_latency_ms, args.certfile, args.keyfile)
+    # A self-signed stand-in certificate is its own CA
+    verify = args.certfile or True
+    payload = {'model': 'stand-in', 'messages': [{'role': 'user', 'content': 'What is a glioma?'}]}
+    pooled = PooledHTTPClient(pool_size=args.concurrency, verify=verify)
+
+    clients = [
+        ('fresh connection', lambda: requests.post(url, json=payload, timeout=30, verify=verify)),
+        ('pooled keep-alive', lambda: pooled.post(url, json=payload)),
+    ]
+
+    print(f"Stand-in upstream at {url} ({args.upstream_latency_ms:g}ms simulated generation)")
+    print(f"{'client':<18}  {'p50':>10}  {'p99':>10}  {'msg/s':>8}")
+    results = {}
+    per_thread = max(1, args.messages // args.concurrency)
+    for label, post in clients:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(args.concurrency) as pool:
+            runs = list(pool.map(lambda _: time_calls(post, per_thread, warmup=1), range(args.concurrency)))
+        elapsed = time.perf_counter() - start
+        latencies = [latency for run in runs for latency in run]
+        results[label] = summarize(latencies)
+        p50, p99 = results[label]
+        print(f"{label:<18}  {p50:>8.2f}ms  {p99:>8.2f}ms  {len(latencies) / elapsed:>8.1f}")
+
+    saved = results['fresh connection'][0] - results['pooled keep-alive'][0]
+    print(f"\nPooling saves {saved:.2f}ms per message at p50")
+    server.shutdown()
+
+
+def parse_list(value):
+    return [v.strip() for v in value.split(',') if v.strip()]
+
+
+def parse_sizes(value):
+    return [int(v) for v in value.split(',') if v.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    inference = subparsers.add_parser('inference', help='compare inference backends')
+    inference.add_argument('--backends', type=parse_list, default=['keras', 'compiled'],
+                           help='comma-separated backend names; the first is the baseline')
+    inference.add_argument('--iterations', type=int, default=50)
+    inference.add_argument('--batch-sizes', type=parse_sizes, default=[1, 4, 8])
+    inference.add_argument('--trace-output',
+                           help='write the baseline backend latencies here for the demo backend to replay')
+    inference.set_defaults(func=bench_inference)
+
+    preprocess = subparsers.add_parser('preprocess', help='float64 vs pooled float32 preprocessing')
+    preprocess.add_argument('--image', help='image file to use (default: synthetic JPEG)')
+    preprocess.add_argument('--size', type=int, default=1024, help='synthetic image size in pixels')
+    preprocess.add_argument('--grayscale', action='store_true',
+                            help='use a single-channel synthetic scan and compare against the RGB path')
+    preprocess.add_argument('--iterations', type=int, default=50)
+    preprocess.set_defaults(func=bench_preprocess)
+
+    decode = subparsers.add_parser('decode', help='full vs draft-mode JPEG decoding')
+    decode.add_argument('--sizes', type=parse_sizes, default=[1024, 2048, 4096],
+                        help='synthetic JPEG sizes in pixels')
+    decode.add_argument('--iterations', type=int, default=20)
+    decode.set_defaults(func=bench_decode)
+
+    chat = subparsers.add_parser('chat', help='fresh vs pooled connections to the chat upstream')
+    chat.add_argument('--messages', type=int, default=200)
+    chat.add_argument('--concurrency', type=int, default=4)
+    chat.add_argument('--upstream-latency-ms', type=float, default=0.0,
+                      help='simulated generation time of the stand-in server')
+    chat.add_argument('--certfile', help='serve the stand-in over TLS with this certificate (PEM)')
+    chat.add_argument('--keyfile', help='private key for --certfile')
+    chat.set_defaults(func=bench_chat)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
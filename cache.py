@@ -0,0 +1,287 @@
+"""Prediction caches keyed by uploaded image content."""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+def content_key(image_bytes, model_version):
+    """Hash the uploaded bytes together with the model version."""
+    digest = hashlib.blake2b(image_bytes, digest_size=16)
+    digest.update(model_version.encode())
+    return digest.hexdigest()
+
+
+class PredictionCache:
+    """Thread-safe in-process LRU cache of class probabilities with a TTL."""
+
+    def __init__(self, max_entries=1024, ttl_seconds=3600):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        """Return the cached probabilities for key, or None."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            probs, stored_at = entry
+            if self.ttl_seconds and now - stored_at > self.ttl_seconds:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return probs
+
+    def put(self, key, probs):
+        """Store probabilities, evicting the least recently used entries."""
+        with self._lock:
+            self._entries[key] = (tuple(float(p) for p in probs), time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl_seconds,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+            }
+
+
+class PersistentPredictionCache:
+    """SQLite-backed prediction store that survives restarts.
+
+    Several worker processes on one host can share the same database file:
+    WAL mode lets readers proceed while one process writes, and each thread
+    (and each forked process) opens its own connection. Entries beyond
+    ``max_entries`` are evicted least recently used first. Database errors
+    are counted and treated as misses so the cache never fails a request.
+    """
+
+    # Only refresh an entry's access time when it is older than this, so
+    # frequent hits on the same scan don't turn every read into a write
+    ACCESS_UPDATE_INTERVAL = 60.0
+    # Check the size budget once every this many writes
+    EVICTION_INTERVAL = 100
+
+    def __init__(self, path, max_entries=100000, ttl_seconds=0):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+        # The store may be created in a pre-fork master, and SQLite connections
+        # must not cross fork: create the schema on a connection closed here
+        conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+        try:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS predictions ('
+                ' key TEXT PRIMARY KEY,'
+                ' probs TEXT NOT NULL,'
+                ' created_at REAL NOT NULL,'
+                ' accessed_at REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS predictions_accessed ON predictions (accessed_at)')
+        finally:
+            conn.close()
+
+    def _connection(self):
+        """Return this thread's connection, reopening it after a fork."""
+        pid, conn = getattr(self._local, 'connection', (None, None))
+        if conn is None or pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA busy_timeout=5000')
+            self._local.connection = (os.getpid(), conn)
+        return conn
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def get(self, key):
+        """Return the stored probabilities for key, or None."""
+        now = time.time()
+        try:
+            conn = self._connection()
+            row = conn.execute(
+                'SELECT probs, created_at, accessed_at FROM predictions WHERE key = ?', (key,)
+            ).fetchone()
+
+            if row is None or (self.ttl_seconds and now - row[1] > self.ttl_seconds):
+                self._count('misses')
+                return None
+
+            if now - row[2] > self.ACCESS_UPDATE_INTERVAL:
+                conn.execute('UPDATE predictions SET accessed_at = ? WHERE key = ?', (now, key))
+        except sqlite3.Error as e:
+            print(f"Prediction store read failed: {e}")
+            self._count('errors')
+            return None
+
+        self._count('hits')
+        return tuple(json.loads(row[0]))
+
+    def put(self, key, probs):
+        """Store probabilities and periodically enforce the size budget."""
+        now = time.time()
+        try:
+            conn = self._connection()
+            conn.execute(
+                'INSERT OR REPLACE INTO predictions (key, probs, created_at, accessed_at) VALUES (?, ?, ?, ?)',
+                (key, json.dumps([float(p) for p in probs]), now, now)
+            )
+
+            with self._lock:
+                self._writes += 1
+                evict = self._writes % self.EVICTION_INTERVAL == 0
+            if evict:
+                self._evict(conn)
+        except sqlite3.Error as e:
+            print(f"Prediction store write failed: {e}")
+            self._count('errors')
+
+    def _evict(self, conn):
+        if self.ttl_seconds:
+            conn.execute('DELETE FROM predictions WHERE created_at < ?', (time.time() - self.ttl_seconds,))
+
+        excess = conn.execute('SELECT COUNT(*) FROM predictions').fetchone()[0] - self.max_entries
+        if excess > 0:
+            conn.execute(
+                'DELETE FROM predictions WHERE key IN '
+                '(SELECT key FROM predictions ORDER BY accessed_at LIMIT ?)', (excess,)
+            )
+
+    def stats(self):
+        try:
+            entries = self._connection().execute('SELECT COUNT(*) FROM predictions').fetchone()[0]
+        except sqlite3.Error:
+            entries = None
+
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'path': self.path,
+                'entries': entries,
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl_seconds,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'errors': self.errors,
+            }
+
+
+_M1 = np.uint64(0x5555555555555555)
+_M2 = np.uint64(0x3333333333333333)
+_M4 = np.uint64(0x0F0F0F0F0F0F0F0F)
+_H01 = np.uint64(0x0101010101010101)
+
+
+def _popcount64(x):
+    """Count the set bits of every element of a uint64 array, in place.
+
+    Uses numpy's bitwise_count where available (numpy 2.0+), else the SWAR
+    bit-count on whole 64-bit words instead of a per-byte table lookup.
+    """
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(x)
+    x -= (x >> np.uint64(1)) & _M1
+    x[:] = (x & _M2) + ((x >> np.uint64(2)) & _M2)
+    x += x >> np.uint64(4)
+    x &= _M4
+    # Wraps modulo 2**64; the top byte holds the sum of all byte counts
+    x *= _H01
+    x >>= np.uint64(56)
+    return x
+
+
+class PerceptualHashIndex:
+    """Bounded index of 64-bit perceptual hashes for near-duplicate lookup.
+
+    Hashes live in one preallocated uint64 array, so a lookup is a single
+    vectorized XOR and popcount over every entry. That scan is linear in the
+    index size, so ``max_entries`` is capped at MAX_ENTRIES to bound the
+    lookup time. Each hash maps to the content key its prediction
+    was cached under. When full, the oldest entry is overwritten.
+    """
+
+    MAX_ENTRIES = 16384
+
+    def __init__(self, max_entries=1024, max_distance=4):
+        self.max_entries = min(max(1, int(max_entries)), self.MAX_ENTRIES)
+        self.max_distance = max_distance
+        self._hashes = np.zeros(self.max_entries, dtype=np.uint64)
+        self._keys = [None] * self.max_entries
+        self._size = 0
+        self._next = 0
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.matches = 0
+
+    def add(self, phash, key):
+        """Remember that the image with this hash was cached under key."""
+        with self._lock:
+            self._hashes[self._next] = phash
+            self._keys[self._next] = key
+            self._next = (self._next + 1) % self.max_entries
+            self._size = min(self._size + 1, self.max_entries)
+
+    def nearest(self, phash):
+        """Return (key, distance) of the closest entry within max_distance, or None."""
+        with self._lock:
+            self.lookups += 1
+            if not self._size:
+                return None
+
+            xor = self._hashes[:self._size] ^ np.uint64(phash)
+            distances = _popcount64(xor)
+            best = int(distances.argmin())
+            distance = int(distances[best])
+            if distance > self.max_distance:
+                return None
+
+            self.matches += 1
+            return self._keys[best], distance
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': self._size,
+                'max_entries': self.max_entries,
+                'max_distance': self.max_distance,
+                'lookups': self.lookups,
+                'matches': self.matches,
+            }
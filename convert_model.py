@@ -1,7 +1,193 @@
+import argparse
+import json
 import sys
 import os
+import time
 
-def convert_model(input_path, output_path):
+import numpy as np
+
+from preprocessing import preprocess_image
+
+# Reduced-precision modes and the output formats they can be written to
+QUANTIZE_FORMATS = {
+    'int8': ('.tflite',),
+    'float16': ('.tflite',),
+    'bfloat16': ('.keras', '.h5'),
+}
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.gif', '.bmp', '.tif', '.tiff')
+
+# Without --eval-dir, every Nth calibration image is held out of int8 calibration for the report
+EVAL_HOLDOUT_EVERY = 5
+
+# Untimed passes through each model before the report starts measuring
+REPORT_WARMUP_RUNS = 5
+
+
+def load_calibration_images(directory, limit, purpose='calibration'):
+    """Preprocess up to `limit` images from a directory exactly as app.py does."""
+    paths = []
+    for root, _, files in os.walk(directory):
+        paths.extend(
+            os.path.join(root, name) for name in files
+            if name.lower().endswith(IMAGE_EXTENSIONS)
+        )
+    paths = sorted(paths)[:limit]
+    
+    if not paths:
+        raise ValueError(f"No images found in {purpose} directory: {directory}")
+    
+    images = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            images.append(preprocess_image(f.read()).astype(np.float32))
+    print(f"Loaded {len(images)} {purpose} images from {directory}")
+    return images
+
+
+def split_holdout(images, every=EVAL_HOLDOUT_EVERY):
+    """Split images into (calibration, held-out) slices.
+    
+    Every `every`-th image is held out, so both slices cover every
+    subdirectory (class) rather than the tail of the sorted list.
+    """
+    held_out = images[every - 1::every]
+    calibration = [image for i, image in enumerate(images) if (i + 1) % every]
+    return calibration, held_out
+
+
+def export_tflite(tf, model, output_path, quantize=None, calibration_images=None):
+    """Convert a Keras model to a TFLite flatbuffer for the tflite backend."""
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    
+    if quantize == 'int8':
+        # Full-integer post-training quantization. Input and output stay float32,
+        # so the tflite backend in app.py serves the result unchanged.
+        def representative_dataset():
+            for image in calibration_images:
+                yield [image]
+        
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = representative_dataset
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    elif quantize == 'float16':
+        # Weights are stored as float16 and dequantized when the model loads
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.target_spec.supported_types = [tf.float16]
+    
+    tflite_model = converter.convert()
+    
+    with open(output_path, 'wb') as f:
+        f.write(tflite_model)
+    print(f"TFLite model size: {len(tflite_model) / (1024 * 1024):.1f} MB")
+
+
+def export_onnx(tf, model, output_path, opset=13):
+    """Convert a Keras model to ONNX for the onnx backend (requires tf2onnx)."""
+    import tf2onnx
+    
+    # Leave the batch dimension dynamic so the server can send any batch size
+    input_signature = (
+        tf.TensorSpec((None,) + tuple(model.input_shape[1:]), tf.float32, name='input'),
+    )
+    tf2onnx.convert.from_keras(
+        model, input_signature=input_signature, opset=opset, output_path=output_path
+    )
+    print(f"ONNX model size: {os.path.getsize(output_path) / (1024 * 1024):.1f} MB")
+
+
+def with_precision_policy(keras, model, policy):
+    """Rebuild a Keras model under a mixed-precision policy, keeping its weights.
+    
+    Every layer (including those of nested models) computes in the policy's
+    dtype except the input and the final classification layer, which stays
+    float32 so the softmax output keeps full precision.
+    """
+    keep_float32 = {model.layers[-1].name}
+    
+    def set_dtypes(layers):
+        for layer in layers:
+            config = layer['config']
+            if layer['class_name'] != 'InputLayer' and config.get('name') not in keep_float32:
+                config['dtype'] = policy
+            if 'layers' in config:
+                set_dtypes(config['layers'])
+    
+    architecture = json.loads(model.to_json())
+    set_dtypes(architecture['config']['layers'])
+    
+    clone = keras.models.model_from_json(json.dumps(architecture))
+    clone.set_weights(model.get_weights())
+    return clone
+
+
+def keras_predictor(tf, model):
+    """Return a single-image predict function running the model as a traced graph, as the server does."""
+    forward = tf.function(lambda x: model(x, training=False))
+    
+    def predict(image):
+        return forward(tf.constant(image)).numpy()[0]
+    
+    return predict
+
+
+def tflite_predictor(tf, model_path, num_threads=None):
+    """Return a single-image predict function backed by a TFLite interpreter."""
+    interpreter = tf.lite.Interpreter(model_path=model_path, num_threads=num_threads)
+    interpreter.allocate_tensors()
+    input_index = interpreter.get_input_details()[0]['index']
+    output_index = interpreter.get_output_details()[0]['index']
+    
+    def predict(image):
+        interpreter.set_tensor(input_index, image)
+        interpreter.invoke()
+        return interpreter.get_tensor(output_index)[0].copy()
+    
+    return predict
+
+
+def quantization_report(float_predict, reduced_predict, label, input_path, output_path, images, threads):
+    """Compare the float model with its reduced-precision variant on held-out images.
+    
+    Both sides are warmed up first and run with the same thread budget, so the
+    latency columns compare the models rather than first-call overhead.
+    """
+    for image in images[:REPORT_WARMUP_RUNS]:
+        float_predict(image)
+        reduced_predict(image)
+    
+    float_probs, quant_probs = [], []
+    float_time, quant_time = 0.0, 0.0
+    for image in images:
+        start = time.perf_counter()
+        float_probs.append(np.asarray(float_predict(image), dtype=np.float32))
+        float_time += time.perf_counter() - start
+        
+        start = time.perf_counter()
+        quant_probs.append(np.asarray(reduced_predict(image), dtype=np.float32))
+        quant_time += time.perf_counter() - start
+    
+    float_probs = np.array(float_probs)
+    quant_probs = np.array(quant_probs)
+    agreement = np.mean(float_probs.argmax(axis=1) == quant_probs.argmax(axis=1)) * 100
+    drift = np.mean(np.abs(float_probs - quant_probs))
+    
+    float_size = os.path.getsize(input_path) / (1024 * 1024)
+    quant_size = os.path.getsize(output_path) / (1024 * 1024)
+    
+    print("\n" + "="*60)
+    print(f"  {label} report ({len(images)} held-out images, {threads} threads)")
+    print("="*60)
+    print(f"{'Metric':<28}{'float32':>14}{label:>14}")
+    print(f"{'Model size (MB)':<28}{float_size:>14.2f}{quant_size:>14.2f}")
+    print(f"{'CPU latency / image (ms)':<28}{float_time / len(images) * 1000:>14.2f}{quant_time / len(images) * 1000:>14.2f}")
+    print(f"{'Top-1 agreement':<28}{'-':>14}{agreement:>13.2f}%")
+    print(f"{'Mean abs probability drift':<28}{'-':>14}{drift:>14.4f}")
+    print("="*60 + "\n")
+
+
+def convert_model(input_path, output_path, quantize=None, calibration_dir=None, calibration_samples=100,
+                  eval_dir=None, eval_samples=100, threads=None):
 
     print(f"Converting model: {input_path} -> {output_path}")
     
@@ -10,37 +196,118 @@ def convert_model(input_path, output_path):
     import tensorflow as tf
     print(f"TensorFlow version: {tf.__version__}")
     
+    # Give TensorFlow the same thread budget as the TFLite interpreter in the report
+    threads = threads or os.cpu_count() or 1
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+    
     print("Loading model...")
     model = tf.keras.models.load_model(input_path, compile=False)
     print(f"Model loaded: {model.name}")
     print(f"Input shape: {model.input_shape}")
     print(f"Output shape: {model.output_shape}")
     
+    calibration_images = None
+    eval_images = None
+    if calibration_dir:
+        calibration_images = load_calibration_images(calibration_dir, calibration_samples)
+    if eval_dir:
+        eval_images = load_calibration_images(eval_dir, eval_samples, purpose='evaluation')
+    elif quantize == 'int8' and calibration_images:
+        # Don't report agreement on the images the quantization ranges were fitted to
+        calibration_images, eval_images = split_holdout(calibration_images)
+        print(f"Holding out {len(eval_images)} calibration images for the report")
+    else:
+        # float16 and bfloat16 are not fitted to the calibration images
+        eval_images = calibration_images
+    
+    saved_model = model
+    if quantize == 'bfloat16':
+        print("Rebuilding model with the mixed_bfloat16 policy...")
+        saved_model = with_precision_policy(tf.keras, model, 'mixed_bfloat16')
+    
     print(f"Saving to: {output_path}")
-    if output_path.endswith('.keras'):
-        model.save(output_path)
+    if output_path.endswith('.tflite'):
+        export_tflite(tf, model, output_path, quantize, calibration_images)
+    elif output_path.endswith('.onnx'):
+        export_onnx(tf, model, output_path)
+    elif output_path.endswith('.keras'):
+        saved_model.save(output_path)
     else:
-        model.save(output_path, save_format='h5')
+        saved_model.save(output_path, save_format='h5')
     
     print("Conversion complete!")
+    
+    if quantize and eval_images:
+        if output_path.endswith('.tflite'):
+            reduced_predict = tflite_predictor(tf, output_path, num_threads=threads)
+        else:
+            reduced_predict = keras_predictor(tf, saved_model)
+        quantization_report(
+            keras_predictor(tf, model), reduced_predict, quantize,
+            input_path, output_path, eval_images, threads
+        )
     return True
 
 
 if __name__ == '__main__':
-    if len(sys.argv) < 3:
-        print("Usage: python convert_model.py <input.h5> <output.keras>")
-        print("\nThis requires TensorFlow 2.15 or earlier (with Keras 2.x)")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(
+        description="Convert the NeuroScan model to another format.",
+        epilog="This requires TensorFlow 2.15 or earlier (with Keras 2.x)"
+    )
+    parser.add_argument('input_file', help="Source model (.h5 or .keras)")
+    parser.add_argument('output_file', help="Target model (.keras, .h5, .tflite or .onnx)")
+    parser.add_argument('--quantize', choices=sorted(QUANTIZE_FORMATS),
+                        help="Reduced-precision variant: int8 and float16 need a .tflite output, "
+                             "bfloat16 a .keras or .h5 output")
+    parser.add_argument('--calibration-dir',
+                        help="Directory of representative MRI images, used for int8 calibration "
+                             "and for the accuracy/latency report")
+    parser.add_argument('--calibration-samples', type=int, default=100,
+                        help="Maximum number of calibration images (default: 100)")
+    parser.add_argument('--eval-dir',
+                        help="Directory of held-out images for the accuracy/latency report "
+                             f"(default: with int8, every {EVAL_HOLDOUT_EVERY}th calibration image is held out)")
+    parser.add_argument('--eval-samples', type=int, default=100,
+                        help="Maximum number of evaluation images (default: 100)")
+    parser.add_argument('--threads', type=int,
+                        help="CPU threads for both models in the report (default: one per core)")
+    args = parser.parse_args()
     
-    input_file = sys.argv[1]
-    output_file = sys.argv[2]
+    input_file = args.input_file
+    output_file = args.output_file
     
     if not os.path.exists(input_file):
         print(f"Error: Input file not found: {input_file}")
         sys.exit(1)
     
+    if args.quantize:
+        formats = QUANTIZE_FORMATS[args.quantize]
+        if not output_file.endswith(formats):
+            print(f"Error: --quantize {args.quantize} requires a {' or '.join(formats)} output file")
+            sys.exit(1)
+        if args.quantize == 'int8' and not args.calibration_dir:
+            print("Error: --quantize int8 requires --calibration-dir pointing to a directory of images")
+            sys.exit(1)
+    
+    if args.calibration_dir and not os.path.isdir(args.calibration_dir):
+        print(f"Error: Calibration directory not found: {args.calibration_dir}")
+        sys.exit(1)
+    
+    if args.eval_dir and not os.path.isdir(args.eval_dir):
+        print(f"Error: Evaluation directory not found: {args.eval_dir}")
+        sys.exit(1)
+    
     try:
-        convert_model(input_file, output_file)
+        convert_model(
+            input_file, output_file,
+            quantize=args.quantize,
+            calibration_dir=args.calibration_dir,
+            calibration_samples=args.calibration_samples,
+            eval_dir=args.eval_dir,
+            eval_samples=args.eval_samples,
+            threads=args.threads
+        )
     except Exception as e:
         print(f"Conversion failed: {e}")
         print("\nMake sure you're using TensorFlow 2.15 or earlier.")
@@ -0,0 +1,69 @@
+"""Gunicorn configuration for serving NeuroScan AI in production.
+
+    gunicorn -c gunicorn.conf.py app:app
+
+The app module is imported once in the master (preload_app) and a TFLite
+model file is read there, so worker processes share those pages copy-on-write.
+Each worker then starts its own inference runtime after fork, with thread
+pools sized so that all workers together use every core once instead of
+each runtime claiming all of them.
+"""
+import os
+
+from tune_threads import apply_thread_config
+
+cores = os.cpu_count() or 1
+
+# Worker and thread counts chosen by tune_threads.py, if it has been run
+apply_thread_config()
+
+bind = os.environ.get('BIND', f"0.0.0.0:{os.environ.get('PORT', '5001')}")
+
+# Inference is CPU-bound, so a few processes with multi-threaded runtimes beat
+# one process per core; request threads mostly wait on uploads, the
+# micro-batcher and the chatbot API.
+workers = int(os.environ.get('WEB_WORKERS', str(min(2, cores))))
+threads = int(os.environ.get('WEB_THREADS', '8'))
+worker_class = 'gthread'
+
+preload_app = True
+
+# Workers load the model in post_fork, before they accept requests
+timeout = int(os.environ.get('WEB_TIMEOUT', '120'))
+graceful_timeout = 30
+keepalive = 5
+
+accesslog = '-'
+errorlog = '-'
+
+# Split the cores between workers. Explicit settings in the environment win.
+# This module runs before app.py is imported, so app.py reads these values.
+inference_threads = max(1, cores // workers)
+for name, value in {
+    'TF_INTRA_OP_THREADS': inference_threads,
+    'TF_INTER_OP_THREADS': min(2, inference_threads),
+    'TFLITE_NUM_THREADS': inference_threads,
+    'ONNX_INTRA_OP_THREADS': inference_threads,
+    'ONNX_INTER_OP_THREADS': 1,
+    'OMP_NUM_THREADS': inference_threads,
+}.items():
+    os.environ.setdefault(name, str(value))
+
+# Never start TensorFlow in the master: its thread pools don't survive fork
+os.environ['EAGER_LOAD'] = 'false'
+
+
+def when_ready(server):
+    """Read the model file in the master once, before any worker is forked."""
+    import app
+    app.preload_model()
+
+
+def post_fork(server, worker):
+    """Start the inference runtime in the new worker before it serves requests."""
+    import app
+    try:
+        app.load_model()
+    except Exception as e:
+        # Leave the worker up; load_model() retries on the first request
+        server.log.error(f"Worker {worker.pid} could not load the model: {e}")
@@ -0,0 +1,139 @@
+"""Pooled keep-alive HTTP client for the chatbot's upstream API."""
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class UpstreamTimeout(Exception):
+    """The upstream API did not connect or answer within the configured timeouts."""
+
+
+class UpstreamError(Exception):
+    """The upstream API answered a streamed request with a non-200 status."""
+
+    def __init__(self, status_code, body):
+        super().__init__(f"Upstream API error: {status_code}")
+        self.status_code = status_code
+        self.body = body
+
+
+def http2_available():
+    """Return True if httpx with HTTP/2 support (the h2 package) is installed."""
+    try:
+        import h2  # noqa: F401
+        import httpx  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class PooledHTTPClient:
+    """Thread-safe HTTP client that reuses connections across requests.
+
+    A fresh ``requests.post`` pays DNS, TCP and a TLS handshake on every call.
+    Here one urllib3 connection pool of ``pool_size`` connections per host is
+    shared by every thread, so consecutive messages reuse warm connections.
+    Each thread gets its own ``requests.Session`` (sessions keep mutable cookie
+    state) mounted on the shared adapter.
+
+    With ``http2`` and httpx[http2] installed, a single ``httpx.Client`` is used
+    instead and requests are multiplexed over one HTTP/2 connection; otherwise
+    it falls back to HTTP/1.1 keep-alive.
+    """
+
+    def __init__(self, pool_size=10, keep_alive=True, connect_timeout=5.0, read_timeout=30.0,
+                 http2=False, verify=True):
+        self.pool_size = pool_size
+        self.keep_alive = keep_alive
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.verify = verify
+        self.http2 = http2 and http2_available()
+        if http2 and not self.http2:
+            print("HTTP/2 requested but httpx[http2] is not installed; using HTTP/1.1 keep-alive")
+
+        self._local = threading.local()
+        self._httpx_client = None
+        if self.http2:
+            import httpx
+            self._httpx_client = httpx.Client(
+                http2=True,
+                verify=verify,
+                timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+                limits=httpx.Limits(
+                    max_connections=pool_size,
+                    max_keepalive_connections=pool_size if keep_alive else 0
+                )
+            )
+        else:
+            self._adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+
+    def _session(self):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            session.mount('https://', self._adapter)
+            session.mount('http://', self._adapter)
+            session.verify = self.verify
+            if not self.keep_alive:
+                session.headers['Connection'] = 'close'
+            self._local.session = session
+        return session
+
+    def post(self, url, headers=None, json=None):
+        """POST JSON and return the response (requests or httpx; same status_code/json/text)."""
+        if self._httpx_client is not None:
+            import httpx
+            try:
+                return self._httpx_client.post(url, headers=headers, json=json)
+            except httpx.TimeoutException as e:
+                raise UpstreamTimeout(str(e)) from e
+
+        try:
+            return self._session().post(
+                url, headers=headers, json=json, timeout=(self.connect_timeout, self.read_timeout)
+            )
+        except requests.Timeout as e:
+            raise UpstreamTimeout(str(e)) from e
+
+    def stream_lines(self, url, headers=None, json=None):
+        """POST JSON and yield the response body line by line as it arrives.
+
+        Used for streamed (Server-Sent Events) completions; the read timeout
+        applies between chunks rather than to the whole response. Raises
+        UpstreamError for a non-200 status.
+        """
+        if self._httpx_client is not None:
+            import httpx
+            try:
+                with self._httpx_client.stream('POST', url, headers=headers, json=json) as response:
+                    if response.status_code != 200:
+                        raise UpstreamError(response.status_code, response.read().decode(errors='replace'))
+                    yield from response.iter_lines()
+            except httpx.TimeoutException as e:
+                raise UpstreamTimeout(str(e)) from e
+            return
+
+        try:
+            with self._session().post(
+                url, headers=headers, json=json, stream=True,
+                timeout=(self.connect_timeout, self.read_timeout)
+            ) as response:
+                if response.status_code != 200:
+                    raise UpstreamError(response.status_code, response.text)
+                # text/event-stream has no charset parameter; SSE is always UTF-8
+                response.encoding = 'utf-8'
+                yield from response.iter_lines(decode_unicode=True)
+        except requests.Timeout as e:
+            raise UpstreamTimeout(str(e)) from e
+
+    def describe(self):
+        """Return a JSON-serializable summary for /health."""
+        return {
+            'transport': 'httpx-http2' if self.http2 else 'requests-http1.1',
+            'pool_size': self.pool_size,
+            'keep_alive': self.keep_alive,
+            'connect_timeout_s': self.connect_timeout,
+            'read_timeout_s': self.read_timeout,
+        }
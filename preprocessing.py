@@ -0,0 +1,172 @@
+"""Image preprocessing shared by the server and convert_model.py."""
+import io
+import os
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+from PIL import Image
+
+# Model input resolution (model.input_shape is (None, 299, 299, 3))
+INPUT_SIZE = 299
+INPUT_SHAPE = (INPUT_SIZE, INPUT_SIZE, 3)
+
+# Let libjpeg decode large JPEGs at 1/2, 1/4 or 1/8 scale (DCT scaling) when
+# the source is at least twice the model input size, instead of decoding every
+# pixel of a 2k-4k export only to throw most of them away in the resize
+JPEG_DRAFT_MODE = os.environ.get('JPEG_DRAFT_MODE', 'true').lower() == 'true'
+
+# Decode single-channel scans as one channel and only broadcast to the model's
+# three channels at the very end, instead of converting them to RGB first
+GRAYSCALE_NATIVE = os.environ.get('GRAYSCALE_NATIVE', 'true').lower() == 'true'
+
+# Pillow modes for grayscale images deeper than 8 bits (16-bit PNG/TIFF exports,
+# 32-bit int/float TIFF)
+HIGH_BIT_DEPTH_MODES = ('I;16', 'I;16L', 'I;16B', 'I;16N', 'I', 'F')
+
+# float32 scale factor; multiplying uint8 pixels by it never creates float64
+_PIXEL_SCALE = np.float32(1.0 / 255.0)
+
+
+def _decode_high_bit_depth(image):
+    """Resize a 16/32-bit grayscale image and window it to float32 [0, 1].
+
+    Converting these modes to RGB clips every value above 255, which turns
+    most of a 12- or 16-bit MRI export white. Instead the raw intensities are
+    resized as floats and stretched from their own min/max, which is what an
+    8-bit export from a DICOM viewer does with the default window.
+    """
+    values = np.asarray(image, dtype=np.float32)
+    resized = np.asarray(
+        Image.fromarray(values, 'F').resize((INPUT_SIZE, INPUT_SIZE)), dtype=np.float32
+    )
+
+    low, high = values.min(), values.max()
+    if high <= low:
+        return np.zeros_like(resized)
+    windowed = (resized - low) / (high - low)
+    # Bicubic resampling can overshoot the source range slightly
+    return np.clip(windowed, 0.0, 1.0, out=windowed)
+
+
+def decode_image(image_data, draft=JPEG_DRAFT_MODE, grayscale=GRAYSCALE_NATIVE):
+    """Decode and resize an uploaded image to model-sized pixels.
+
+    Returns uint8 (299, 299, 3) for colour images. 16/32-bit grayscale images
+    come back as float32 (299, 299) already scaled to [0, 1], and with
+    ``grayscale`` enabled 8-bit grayscale images come back as uint8
+    (299, 299). normalize_into broadcasts single-channel pixels to the three
+    model channels.
+    """
+    # Open image from bytes (only the header is read here)
+    image = Image.open(io.BytesIO(image_data))
+
+    # Reduced-scale decode; draft() keeps both sides >= the requested size
+    if draft and image.format == 'JPEG' and min(image.size) >= 2 * INPUT_SIZE:
+        image.draft(None, (INPUT_SIZE, INPUT_SIZE))
+
+    # Deep grayscale always takes the windowed path; convert('RGB') would clip it
+    if image.mode in HIGH_BIT_DEPTH_MODES:
+        return _decode_high_bit_depth(image)
+
+    if grayscale and image.mode in ('L', 'LA'):
+        # Single channel: resize a third of the pixels an RGB copy would have
+        if image.mode == 'LA':
+            image = image.convert('L')
+        return np.asarray(image.resize((INPUT_SIZE, INPUT_SIZE)))
+
+    # Convert to RGB if necessary
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+
+    # Resize to model input size (299x299 based on model.input_shape)
+    image = image.resize((INPUT_SIZE, INPUT_SIZE))
+
+    return np.asarray(image)
+
+
+def normalize_into(pixels, out):
+    """Scale decoded pixels to [0, 1] directly into a float32 (299, 299, 3) slot."""
+    if pixels.ndim == 2:
+        # Grayscale: broadcast the single channel into all three model channels
+        pixels = pixels[..., np.newaxis]
+
+    if pixels.dtype == np.uint8:
+        np.multiply(pixels, _PIXEL_SCALE, out=out, dtype=np.float32)
+    else:
+        # High-bit-depth grayscale is already windowed to [0, 1]
+        np.copyto(out, pixels)
+    return out
+
+
+def preprocess_image(image_data):
+    """Preprocess the uploaded image for model prediction."""
+    # Allocate the float32 batch of one and normalize into it in place
+    img_array = np.empty((1,) + INPUT_SHAPE, dtype=np.float32)
+    normalize_into(decode_image(image_data), img_array[0])
+    return img_array
+
+
+class BatchBufferPool:
+    """Reusable float32 (batch_size, 299, 299, 3) input buffers.
+
+    Each buffer is ~10 MB at batch size 32, so allocating one per request is
+    both slow and a large share of per-request peak memory. Up to
+    ``max_buffers`` are kept; if all are in use a temporary one is allocated.
+    """
+
+    def __init__(self, batch_size, max_buffers=4):
+        self.batch_size = batch_size
+        self.max_buffers = max_buffers
+        self._free = []
+        self._pooled_ids = set()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            if self._free:
+                return self._free.pop()
+
+            buffer = np.empty((self.batch_size,) + INPUT_SHAPE, dtype=np.float32)
+            if len(self._pooled_ids) < self.max_buffers:
+                self._pooled_ids.add(id(buffer))
+            return buffer
+
+    def release(self, buffer):
+        # Temporary buffers allocated while the pool was exhausted are dropped
+        with self._lock:
+            if id(buffer) in self._pooled_ids:
+                self._free.append(buffer)
+
+    @contextmanager
+    def buffer(self):
+        """Borrow a buffer for the duration of a with-block."""
+        buffer = self.acquire()
+        try:
+            yield buffer
+        finally:
+            self.release(buffer)
+
+
+def perceptual_hash(pixels):
+    """Return a 64-bit difference hash (dHash) of decoded model-sized pixels.
+
+    The image is reduced to a 9x8 grayscale thumbnail and each bit records
+    whether a cell is brighter than its right-hand neighbour. Re-compression,
+    metadata changes and small crops or shifts flip only a few bits, so
+    near-identical scans are a small Hamming distance apart.
+    """
+    if pixels.ndim == 3:
+        # ITU-R 601 luma, the same weights as Pillow's convert('L')
+        gray = pixels @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+    else:
+        gray = pixels.astype(np.float32, copy=False)
+        if pixels.dtype != np.uint8:
+            # Windowed high-bit-depth pixels are in [0, 1]
+            gray = gray * 255.0
+
+    thumbnail = np.asarray(
+        Image.fromarray(np.ascontiguousarray(gray, dtype=np.float32), 'F').resize((9, 8), Image.BOX)
+    )
+    bits = (thumbnail[:, 1:] > thumbnail[:, :-1]).ravel()
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
@@ -115,13 +115,12 @@ function handleFile(file) {
 
     currentFile = file;
 
-    // Create preview
-    const reader = new FileReader();
-    reader.onload = (e) => {
-        previewImage.src = e.target.result;
-        showPreview();
-    };
-    reader.readAsDataURL(file);
+    // Create preview (object URL: no base64 copy of the file)
+    if (previewImage.src.startsWith('blob:')) {
+        URL.revokeObjectURL(previewImage.src);
+    }
+    previewImage.src = URL.createObjectURL(file);
+    showPreview();
 }
 
 /**
@@ -180,6 +179,9 @@ function showResults(data) {
 function resetToUpload() {
     currentFile = null;
     fileInput.value = '';
+    if (previewImage.src.startsWith('blob:')) {
+        URL.revokeObjectURL(previewImage.src);
+    }
     previewImage.src = '';
 
     uploadSection.classList.remove('hidden');
@@ -206,16 +208,13 @@ async function analyzeMRI() {
     showLoading();
 
     try {
-        // Convert file to base64
-        const base64 = await fileToBase64(currentFile);
-
-        // Send to API
+        // Send the file as the raw request body (no base64 or JSON wrapping)
         const response = await fetch('/predict', {
             method: 'POST',
             headers: {
-                'Content-Type': 'application/json'
+                'Content-Type': currentFile.type || 'application/octet-stream'
             },
-            body: JSON.stringify({ image: base64 })
+            body: currentFile
         });
 
         const data = await response.json();
@@ -234,18 +233,6 @@ async function analyzeMRI() {
     }
 }
 
-/**
- * Convert file to base64
- */
-function fileToBase64(file) {
-    return new Promise((resolve, reject) => {
-        const reader = new FileReader();
-        reader.onload = () => resolve(reader.result);
-        reader.onerror = reject;
-        reader.readAsDataURL(file);
-    });
-}
-
 /**
  * Render results
  */
@@ -396,7 +383,7 @@ function initChatbot() {
 }
 
 /**
- * Send chat message
+ * Send chat message and render the reply as it streams in
  */
 async function sendChatMessage() {
     const chatInput = document.getElementById('chatInput');
@@ -413,14 +400,31 @@ async function sendChatMessage() {
     // Add user message
     addChatMessage(message, 'user');
 
-    // Add typing indicator
-    const typingIndicator = addTypingIndicator();
+    // Add typing indicator (shown until the first token arrives)
+    let typingIndicator = addTypingIndicator();
+    const removeTypingIndicator = () => {
+        if (typingIndicator) {
+            typingIndicator.remove();
+            typingIndicator = null;
+        }
+    };
 
     // Scroll to bottom
     chatMessages.scrollTop = chatMessages.scrollHeight;
 
+    let botMessage = null;
+    let replyText = '';
+    let renderPending = false;
+
+    // Re-render the markdown at most once per frame while tokens arrive
+    const renderReply = () => {
+        renderPending = false;
+        botMessage.querySelector('.chat-message__content p').innerHTML = parseMarkdown(replyText);
+        chatMessages.scrollTop = chatMessages.scrollHeight;
+    };
+
     try {
-        const response = await fetch('/chat', {
+        const response = await fetch('/chat/stream', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json'
@@ -428,25 +432,86 @@ async function sendChatMessage() {
             body: JSON.stringify({ message })
         });
 
-        const data = await response.json();
+        const contentType = response.headers.get('Content-Type') || '';
+        if (!contentType.startsWith('text/event-stream')) {
+            const data = await response.json();
+            removeTypingIndicator();
+            addChatMessage(data.response || data.error || 'Sorry, I could not process your request.', 'bot');
+            return;
+        }
 
-        // Remove typing indicator
-        typingIndicator.remove();
+        await readServerSentEvents(response, (event, data) => {
+            if (event === 'error') {
+                removeTypingIndicator();
+                addChatMessage(data.response || data.error || 'Sorry, I could not process your request.', 'bot');
+            } else if (data.token) {
+                if (!botMessage) {
+                    removeTypingIndicator();
+                    botMessage = addChatMessage('', 'bot');
+                }
+                replyText += data.token;
+                if (!renderPending) {
+                    renderPending = true;
+                    requestAnimationFrame(renderReply);
+                }
+            }
+        });
 
-        // Add bot response
-        addChatMessage(data.response || data.error || 'Sorry, I could not process your request.', 'bot');
+        removeTypingIndicator();
+        if (!botMessage && !chatMessages.lastElementChild.classList.contains('chat-message--bot')) {
+            addChatMessage('Sorry, I could not process your request.', 'bot');
+        }
 
     } catch (error) {
         console.error('Chat error:', error);
-        typingIndicator.remove();
+        removeTypingIndicator();
         addChatMessage('Sorry, there was an error connecting to the server.', 'bot');
     } finally {
+        if (botMessage) {
+            renderReply();
+        }
         chatSend.disabled = false;
         chatInput.focus();
         chatMessages.scrollTop = chatMessages.scrollHeight;
     }
 }
 
+/**
+ * Read a text/event-stream response body, calling onEvent(event, data) for
+ * each event as it arrives (EventSource only supports GET requests)
+ */
+async function readServerSentEvents(response, onEvent) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        // Events are separated by a blank line
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const rawEvent = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+
+            let event = 'message';
+            const dataLines = [];
+            for (const line of rawEvent.split('\n')) {
+                if (line.startsWith('event:')) {
+                    event = line.slice(6).trim();
+                } else if (line.startsWith('data:')) {
+                    dataLines.push(line.slice(5).trim());
+                }
+            }
+            if (dataLines.length) {
+                onEvent(event, JSON.parse(dataLines.join('\n')));
+            }
+        }
+    }
+}
+
 /**
  * Add message to chat
  */
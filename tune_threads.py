@@ -0,0 +1,235 @@
+"""Find the worker and inference thread counts that serve /predict fastest.
+
+Usage:
+    python tune_threads.py [--backend compiled] [--workers 1,2,4] [--intra-op 1,2,4] [--inter-op 1,2]
+
+Every combination runs as real worker processes on this host, each driving its
+own app under closed-loop synthetic /predict load, so the processes compete
+for cores exactly as Gunicorn workers would. Throughput and p99 latency are
+reported per setting and the best one is written to thread_config.json, which
+app.py and gunicorn.conf.py apply at startup before the model is loaded.
+"""
+import argparse
+import itertools
+import json
+import os
+import queue
+import threading
+import time
+
+# Tuned settings file; THREAD_CONFIG_PATH= (empty) disables it
+DEFAULT_THREAD_CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'thread_config.json')
+
+# Environment variables holding each backend's intra-op and inter-op thread counts
+BACKEND_THREAD_SETTINGS = {
+    'keras': ('TF_INTRA_OP_THREADS', 'TF_INTER_OP_THREADS'),
+    'compiled': ('TF_INTRA_OP_THREADS', 'TF_INTER_OP_THREADS'),
+    'tflite': ('TFLITE_NUM_THREADS', None),
+    'onnx': ('ONNX_INTRA_OP_THREADS', 'ONNX_INTER_OP_THREADS'),
+}
+
+# Seconds a setting's workers may take to load the model, on top of the load duration
+WORKER_STARTUP_TIMEOUT = 300
+
+
+def thread_config_path():
+    return os.environ.get('THREAD_CONFIG_PATH', DEFAULT_THREAD_CONFIG_PATH)
+
+
+def apply_thread_config(path=None):
+    """Export the tuned settings as environment defaults.
+
+    Variables already set in the environment are left alone, so an explicit
+    setting always overrides the tuned one. Returns the applied settings.
+    """
+    path = thread_config_path() if path is None else path
+    if not path or not os.path.exists(path):
+        return {}
+
+    try:
+        with open(path) as f:
+            settings = json.load(f)['settings']
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Ignoring thread config {path}: {e}")
+        return {}
+
+    applied = {}
+    for name, value in settings.items():
+        if name not in os.environ:
+            os.environ[name] = str(value)
+            applied[name] = value
+    return applied
+
+
+def candidate_settings(backend, workers, intra_op, inter_op):
+    """Return the environment for one (workers, intra, inter) combination."""
+    intra_name, inter_name = BACKEND_THREAD_SETTINGS[backend]
+    settings = {'WEB_WORKERS': workers, intra_name: intra_op, 'OMP_NUM_THREADS': intra_op}
+    if inter_name:
+        settings[inter_name] = inter_op
+    return settings
+
+
+def _load_worker(settings, backend, clients, duration, image_data, barrier, results):
+    """Run in a spawned process: load the app, then drive /predict until time is up."""
+    os.environ.update({name: str(value) for name, value in settings.items()})
+    os.environ.update({
+        'MODEL_BACKEND': backend,
+        # Measure inference, not cache hits, and ignore any earlier tuning result
+        'RESULT_CACHE_ENABLED': 'false',
+        'PREDICTION_DB_PATH': '',
+        'NEAR_DUPLICATE_POLICY': 'off',
+        'THREAD_CONFIG_PATH': '',
+    })
+    try:
+        import app as server
+
+        server.load_model()
+        # load_model() falls back to demo mode when the runtime is missing;
+        # timing that stub would be recorded as this backend's best setting
+        if server.MODEL_BACKEND != backend:
+            raise RuntimeError(f"the '{backend}' backend did not load (serving '{server.MODEL_BACKEND}')")
+        # Start the clock in every worker at once so they overlap fully
+        barrier.wait()
+    except Exception as e:
+        print(f"Worker failed to start: {e}")
+        barrier.abort()
+        results.put([])
+        return
+
+    latencies = []
+    latencies_lock = threading.Lock()
+    stop_at = time.perf_counter() + duration
+
+    def client():
+        http = server.app.test_client()
+        own = []
+        while time.perf_counter() < stop_at:
+            start = time.perf_counter()
+            response = http.post('/predict', data=image_data, content_type='image/jpeg')
+            if response.status_code == 200:
+                own.append((time.perf_counter() - start) * 1000)
+        with latencies_lock:
+            latencies.extend(own)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    results.put(latencies)
+
+
+def measure(settings, args, image_data):
+    """Return (requests/s, p50 ms, p99 ms) for one setting across all its workers."""
+    import multiprocessing
+
+    from benchmark import summarize
+
+    context = multiprocessing.get_context('spawn')
+    workers = settings['WEB_WORKERS']
+    barrier = context.Barrier(workers)
+    results = context.Queue()
+    # Keep the offered load the same whatever the worker count
+    clients = max(1, -(-args.clients // workers))
+
+    processes = [
+        context.Process(
+            target=_load_worker,
+            args=(settings, args.backend, clients, args.duration, image_data, barrier, results)
+        )
+        for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+
+    # A worker killed before it reports (OOM, segfault) must not hang the sweep
+    latencies = []
+    reported = 0
+    give_up_at = time.monotonic() + WORKER_STARTUP_TIMEOUT + args.duration
+    while reported < workers:
+        try:
+            latencies.extend(results.get(timeout=1.0))
+            reported += 1
+        except queue.Empty:
+            crashed = [p.exitcode for p in processes if p.exitcode not in (None, 0)]
+            if crashed or time.monotonic() > give_up_at:
+                reason = f"exited with code {crashed[0]}" if crashed else "timed out"
+                print(f"A worker {reason} before reporting; skipping this setting")
+                latencies = []
+                break
+    for process in processes:
+        if process.is_alive() and reported < workers:
+            process.terminate()
+        process.join()
+
+    if not latencies:
+        return 0.0, float('inf'), float('inf')
+    p50, p99 = summarize(latencies)
+    return len(latencies) / args.duration, p50, p99
+
+
+def tune(args):
+    from benchmark import synthetic_jpeg
+
+    cores = os.cpu_count() or 1
+    image_data = synthetic_jpeg(args.image_size)
+    inter_options = args.inter_op if BACKEND_THREAD_SETTINGS[args.backend][1] else [1]
+
+    results = []
+    print(f"{'workers':>7}  {'intra':>5}  {'inter':>5}  {'req/s':>8}  {'p50':>10}  {'p99':>10}")
+    for workers, intra_op, inter_op in itertools.product(args.workers, args.intra_op, inter_options):
+        if workers * intra_op > cores and not args.allow_oversubscription:
+            continue
+        settings = candidate_settings(args.backend, workers, intra_op, inter_op)
+        throughput, p50, p99 = measure(settings, args, image_data)
+        results.append((settings, throughput, p99))
+        print(f"{workers:>7}  {intra_op:>5}  {inter_op:>5}  {throughput:>8.1f}  {p50:>8.2f}ms  {p99:>8.2f}ms")
+
+    # Settings whose workers failed measured nothing
+    eligible = [
+        r for r in results
+        if r[1] > 0 and (args.max_p99_ms is None or r[2] <= args.max_p99_ms)
+    ]
+    if not eligible:
+        print("\nNo setting ran successfully and met the p99 target; thread config not written.")
+        return
+
+    settings, throughput, p99 = max(eligible, key=lambda r: r[1])
+    config = {
+        'backend': args.backend,
+        'cores': cores,
+        'settings': settings,
+        'throughput_rps': round(throughput, 2),
+        'p99_ms': round(p99, 3),
+        'tuned_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+    with open(args.output, 'w') as f:
+        json.dump(config, f, indent=2)
+    print(f"\nBest: {settings} ({throughput:.1f} req/s, p99 {p99:.2f}ms) -> {args.output}")
+
+
+def parse_counts(value):
+    return [int(v) for v in value.split(',') if v.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--backend', default=os.environ.get('MODEL_BACKEND', 'compiled').lower(),
+                        choices=sorted(BACKEND_THREAD_SETTINGS))
+    parser.add_argument('--workers', type=parse_counts, default=[1, 2, 4])
+    parser.add_argument('--intra-op', type=parse_counts, default=[1, 2, 4, 8])
+    parser.add_argument('--inter-op', type=parse_counts, default=[1, 2])
+    parser.add_argument('--clients', type=int, default=16,
+                        help='concurrent synthetic clients, split across the workers')
+    parser.add_argument('--duration', type=float, default=20.0, help='seconds of load per setting')
+    parser.add_argument('--image-size', type=int, default=512, help='synthetic JPEG size in pixels')
+    parser.add_argument('--max-p99-ms', type=float, help='only pick settings at or below this p99')
+    parser.add_argument('--allow-oversubscription', action='store_true',
+                        help='also try settings where workers x intra-op threads exceed the core count')
+    parser.add_argument('--output', default=thread_config_path() or DEFAULT_THREAD_CONFIG_PATH)
+    tune(parser.parse_args())
+
+
+if __name__ == '__main__':
+    main()